@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+_CLOSE = object()
+
+
+class BatchQueueFull(Exception):
+    pass
+
+
+class BatchQueue:
+    """ Отложенная запись: элементы копятся в ограниченной очереди и сбрасываются по batch_size или раз в interval """
+    def __init__(self, flush: Callable[[list], Awaitable[Any]], maxsize: int, batch_size: int, interval: float,
+                 retries: int = 3, backoff: float = 0.1):
+        self.flush = flush
+        self.batch_size = batch_size
+        self.interval = interval
+        self.retries = retries
+        self.backoff = backoff
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._task: asyncio.Task | None = None
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.flush_seconds = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    def put(self, item: Any) -> None:
+        """ Без ожидания: при переполнении очереди клиент получает отказ, а не висящий запрос """
+        if not self.running:
+            raise BatchQueueFull('Batch queue is not running')
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise BatchQueueFull('Batch queue is full')
+        self.enqueued += 1
+
+    async def close(self) -> None:
+        """ Дожидается сброса всего, что уже принято в очередь """
+        if not self.running:
+            return
+        await self._queue.put(_CLOSE)
+        await self._task
+        self._task = None
+
+    async def _collect(self) -> tuple[list, bool]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.batch_size and batch[-1] is not _CLOSE:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        closing = batch[-1] is _CLOSE
+        return (batch[:-1] if closing else batch), closing
+
+    async def _run(self) -> None:
+        closing = False
+        while not closing:
+            batch, closing = await self._collect()
+            if not batch:
+                continue
+            started = time.perf_counter()
+            await self._flush(batch)
+            self.batches += 1
+            self.flush_seconds += time.perf_counter() - started
+
+    async def _flush(self, batch: list) -> None:
+        """ Сброс с ограниченным числом повторов; пауза между попытками растет вдвое """
+        for attempt in range(self.retries + 1):
+            try:
+                await self.flush(batch)
+            except Exception:
+                self.failed += 1
+                if attempt == self.retries:
+                    # Повторы исчерпаны: пачка теряется, но цикл сброса продолжает работать
+                    self.dropped += len(batch)
+                    logger.exception('Dropped batch of %d items after %d attempts', len(batch), attempt + 1)
+                    return
+                logger.warning('Failed to flush batch of %d items, retrying', len(batch), exc_info=True)
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                self.flushed += len(batch)
+                return
+
+    def stats(self) -> dict:
+        return {
+            'running': self.running,
+            'depth': self._queue.qsize(),
+            'maxsize': self._queue.maxsize,
+            'batch_size': self.batch_size,
+            'interval': self.interval,
+            'enqueued': self.enqueued,
+            'rejected': self.rejected,
+            'flushed': self.flushed,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'retries': self.retries,
+            'batches': self.batches,
+            'flush_seconds_total': round(self.flush_seconds, 6),
+        }
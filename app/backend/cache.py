@@ -0,0 +1,59 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+_MISSING = object()
+
+
+class TTLCache:
+    """ Ограниченный LRU-кэш с временем жизни записей и счетчиками попаданий """
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            self.misses += 1
+            return default
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None, expires_at: float | None = None) -> None:
+        """ Время жизни задается через ttl в секундах или абсолютным expires_at (unix time) """
+        ttl = self.ttl if ttl is None else ttl
+        if expires_at is None and ttl is not None:
+            expires_at = time.time() + ttl
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+import time
+
+from sqlalchemy import Float, and_, case, cast, delete, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.db import async_session_marker
+from app.backend.response_cache import response_cache
+from app.models import Category, CategoryRollup, Product
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер проверяет флаг изменений и пересчитывает агрегаты
+CATEGORY_ROLLUP_INTERVAL = float(os.environ.get('CATEGORY_ROLLUP_INTERVAL', 30))
+
+
+async def refresh_rollups(db: AsyncSession) -> None:
+    """ Пересчет агрегатов всех категорий двумя запросами: рекурсивный CTE + UPSERT и удаление лишних строк """
+    tree = (select(Category.id.label('ancestor_id'), Category.id.label('category_id'))
+            .where(Category.is_active == True).cte('tree', recursive=True))
+    # UNION, а не UNION ALL: повторяющиеся пары отбрасываются, так что даже цикл в дереве не зациклит запрос
+    tree = tree.union(select(tree.c.ancestor_id, Category.id)
+                      .where(Category.parent_id == tree.c.category_id, Category.is_active == True))
+    rating_sum = func.coalesce(func.sum(Product.rating_sum), 0)
+    reviews_count = func.coalesce(func.sum(Product.reviews_count), 0)
+    totals = (
+        select(tree.c.ancestor_id, func.count(Product.id), rating_sum, reviews_count,
+               case((reviews_count > 0, cast(rating_sum, Float) / reviews_count), else_=0.0), func.now())
+        .select_from(tree)
+        .outerjoin(Product, and_(Product.category_id == tree.c.category_id, Product.is_active == True))
+        .group_by(tree.c.ancestor_id)
+    )
+    upsert = insert(CategoryRollup).from_select(
+        ['category_id', 'product_count', 'rating_sum', 'reviews_count', 'rating', 'refreshed_at'], totals)
+    await db.execute(upsert.on_conflict_do_update(
+        index_elements=[CategoryRollup.category_id],
+        set_={name: upsert.excluded[name]
+              for name in ('product_count', 'rating_sum', 'reviews_count', 'rating', 'refreshed_at')},
+    ))
+    await db.execute(delete(CategoryRollup).where(
+        CategoryRollup.category_id.not_in(select(Category.id).where(Category.is_active == True))))
+
+
+class RollupRefresher:
+    """ Фоновый пересчет агрегатов: пути записи помечают данные измененными, задача пересчитывает раз в интервал """
+    def __init__(self, interval: float = CATEGORY_ROLLUP_INTERVAL):
+        self.interval = interval
+        # При старте агрегаты могли устареть, пока приложение не работало
+        self.dirty = True
+        self.refreshes = 0
+        self.refresh_seconds = 0.0
+        self._task: asyncio.Task | None = None
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+
+    async def refresh(self) -> bool:
+        # Флаг снимается до запроса: изменения во время пересчета вызовут следующий
+        self.dirty = False
+        started = time.perf_counter()
+        try:
+            async with async_session_marker() as db:
+                await refresh_rollups(db)
+                await db.commit()
+        except (SQLAlchemyError, OSError):
+            self.dirty = True
+            logger.warning('Category rollup refresh failed', exc_info=True)
+            return False
+        self.refreshes += 1
+        self.refresh_seconds += time.perf_counter() - started
+        await response_cache.bump('category_rollup')
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            if self.dirty:
+                try:
+                    await self.refresh()
+                except Exception:
+                    # Непредвиденная ошибка не должна останавливать задачу: пересчет повторится в следующий интервал
+                    self.dirty = True
+                    logger.exception('Category rollup refresh crashed')
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+rollup_refresher = RollupRefresher()
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Iterable
+
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.db import async_session_marker
+from app.models import Category
+
+logger = logging.getLogger(__name__)
+
+# Каждый воркер держит свою копию дерева, TTL ограничивает рассинхронизацию между процессами
+CATEGORY_TREE_TTL = float(os.environ.get('CATEGORY_TREE_TTL', 300))
+
+
+class CategoryTree:
+    """ Дерево категорий в памяти: смежность и готовые множества потомков """
+    def __init__(self, ttl: float = CATEGORY_TREE_TTL):
+        self.ttl = ttl
+        self._parents: dict[int, int | None] = {}
+        self._children: dict[int, set[int]] = {}
+        self._descendants: dict[int, frozenset[int]] = {}
+        self._loaded_at: float | None = None
+        self._refresh_task: asyncio.Task | None = None
+
+    @property
+    def is_warm(self) -> bool:
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def build(self, rows: Iterable[tuple[int, int | None]]) -> None:
+        parents = dict(rows)
+        children: dict[int, set[int]] = {category_id: set() for category_id in parents}
+        for category_id, parent_id in parents.items():
+            if parent_id in children:
+                children[parent_id].add(category_id)
+        self._parents = parents
+        self._children = children
+        self._descendants = {}
+        for category_id in parents:
+            self._collect(category_id)
+        self._loaded_at = time.monotonic()
+
+    def _collect(self, category_id: int) -> frozenset[int]:
+        # Итеративный обход, чтобы глубокое дерево не упиралось в лимит рекурсии
+        stack, order, seen = [category_id], [], set()
+        while stack:
+            node = stack.pop()
+            if node in seen or node in self._descendants:
+                continue
+            seen.add(node)
+            order.append(node)
+            stack.extend(self._children.get(node, ()))
+        for node in reversed(order):
+            subtree = {node}
+            for child in self._children.get(node, ()):
+                subtree |= self._descendants.get(child, {child})
+            self._descendants[node] = frozenset(subtree)
+        return self._descendants[category_id]
+
+    def _ancestors(self, category_id: int | None) -> list[int]:
+        ancestors = []
+        while category_id is not None and category_id in self._parents and category_id not in ancestors:
+            ancestors.append(category_id)
+            category_id = self._parents[category_id]
+        return ancestors
+
+    def subtree(self, category_id: int) -> frozenset[int] | None:
+        """ Категория и все ее потомки; None, если кэш холодный """
+        if not self.is_warm:
+            return None
+        return self._descendants.get(category_id)
+
+    def ids(self) -> frozenset[int]:
+        return frozenset(self._parents)
+
+    def would_cycle(self, category_id: int, parent_id: int | None) -> bool:
+        if parent_id is None or not self.is_warm:
+            return False
+        return parent_id in self._descendants.get(category_id, frozenset((category_id,)))
+
+    def add(self, category_id: int, parent_id: int | None) -> None:
+        if self._loaded_at is None:
+            return
+        self._parents[category_id] = parent_id
+        self._children.setdefault(category_id, set())
+        self._descendants[category_id] = frozenset((category_id,))
+        if parent_id in self._children:
+            self._children[parent_id].add(category_id)
+        for ancestor in self._ancestors(parent_id):
+            self._descendants[ancestor] = self._descendants[ancestor] | {category_id}
+
+    def move(self, category_id: int, parent_id: int | None) -> None:
+        if self._loaded_at is None:
+            return
+        if category_id not in self._parents:
+            self.add(category_id, parent_id)
+            return
+        old_parent = self._parents[category_id]
+        if old_parent == parent_id:
+            return
+        subtree = self._descendants[category_id]
+        for ancestor in self._ancestors(old_parent):
+            self._descendants[ancestor] = self._descendants[ancestor] - subtree
+        if old_parent in self._children:
+            self._children[old_parent].discard(category_id)
+        self._parents[category_id] = parent_id
+        if parent_id in self._children:
+            self._children[parent_id].add(category_id)
+        for ancestor in self._ancestors(parent_id):
+            self._descendants[ancestor] = self._descendants[ancestor] | subtree
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    async def load(self, db: AsyncSession) -> None:
+        rows = await db.execute(select(Category.id, Category.parent_id))
+        self.build(rows.tuples().all())
+
+    async def refresh(self) -> None:
+        """ Перезагрузка дерева в собственной сессии """
+        try:
+            async with async_session_marker() as db:
+                await self.load(db)
+        except (SQLAlchemyError, OSError):
+            logger.warning('Category tree refresh failed', exc_info=True)
+
+    def schedule_refresh(self) -> None:
+        """ Фоновая перезагрузка, одновременно выполняется не больше одной """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+
+async def fetch_subtree(db: AsyncSession, category_id: int) -> list[int]:
+    """ Потомки категории одним рекурсивным CTE, когда кэш холодный """
+    tree = select(Category.id).where(Category.id == category_id).cte('tree', recursive=True)
+    tree = tree.union(select(Category.id).where(Category.parent_id == tree.c.id))
+    return list((await db.scalars(select(tree.c.id))).all())
+
+
+category_tree = CategoryTree()
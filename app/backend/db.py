@@ -1,14 +1,111 @@
 import os
+import time
+from dataclasses import dataclass, fields
 
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 load_dotenv()
 
+
+@dataclass(frozen=True)
+class EngineSettings:
+    """ Настройки движка и пула соединений, читаются из переменных окружения с префиксом """
+    echo: bool = False
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30.0
+    pool_recycle: int = 1800
+    pool_pre_ping: bool = True
+    statement_cache_size: int = 100
+
+    @classmethod
+    def from_env(cls, prefix: str = 'DB_', base: 'EngineSettings | None' = None) -> 'EngineSettings':
+        values = {}
+        for field in fields(cls):
+            default = getattr(base or cls, field.name)
+            raw = os.environ.get(f'{prefix}{field.name.upper()}')
+            if raw is None:
+                values[field.name] = default
+            elif field.type is bool:
+                values[field.name] = raw.strip().lower() in ('1', 'true', 'yes', 'on')
+            else:
+                values[field.name] = type(default)(raw)
+        return cls(**values)
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """ Пул соединений, который считает выдачи и замеряет ожидание, когда свободных соединений нет """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_count = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        self.checkouts += 1
+        # Ожидание бывает, только когда очередь пуста и overflow исчерпан; выдачи из очереди и открытие
+        # нового соединения сверх pool_size не считаются, иначе в замер попадало бы время подключения
+        contended = self._pool.empty() and -1 < self._max_overflow <= self._overflow
+        if not contended:
+            return super()._do_get()
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            self.wait_count += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def create_engine(database_url: str, settings: EngineSettings) -> AsyncEngine:
+    connect_args = {}
+    if database_url.startswith('postgresql+asyncpg'):
+        connect_args['prepared_statement_cache_size'] = settings.statement_cache_size
+    return create_async_engine(
+        database_url,
+        echo=settings.echo,
+        poolclass=TimedQueuePool,
+        pool_size=settings.pool_size,
+        max_overflow=settings.max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+        connect_args=connect_args,
+    )
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    pool = engine.pool
+    stats = {
+        'size': pool.size(),
+        'checked_in': pool.checkedin(),
+        'checked_out': pool.checkedout(),
+        'overflow': pool.overflow(),
+    }
+    if isinstance(pool, TimedQueuePool):
+        stats.update(
+            checkouts=pool.checkouts,
+            wait_count=pool.wait_count,
+            wait_seconds_total=round(pool.wait_seconds, 6),
+            wait_seconds_max=round(pool.max_wait_seconds, 6),
+        )
+    return stats
+
+
 url = os.environ.get("DATABASE_URL")
-engine = create_async_engine(url, echo=True)
+engine_settings = EngineSettings.from_env('DB_')
+engine = create_engine(url, engine_settings)
 async_session_marker = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
 
+# Реплика для чтения необязательна: без DATABASE_READ_URL чтение идет через основной движок
+read_url = os.environ.get("DATABASE_READ_URL")
+read_engine = create_engine(read_url, EngineSettings.from_env('DB_READ_', engine_settings)) if read_url else engine
+async_read_session_marker = async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
+
 class Base(DeclarativeBase):
-    pass
\ No newline at end of file
+    pass
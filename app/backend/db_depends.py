@@ -1,10 +1,74 @@
+import os
+import time
 from typing import AsyncGenerator
 
+from fastapi import Request
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
-from app.backend.db import async_session_marker
+from app.backend.db import async_session_marker, async_read_session_marker
 
-async def get_db() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session_marker() as session:
+# Сколько секунд после своей записи клиент читает с основного сервера, а не с реплики
+READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5))
+_RECENT_WRITES_LIMIT = 10_000
+_SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Ключ - id пользователя из access-токена, так что отметка переживает ротацию токенов
+_recent_writes: dict[int, float] = {}
+
+
+def _writer_key(request: Request) -> int | None:
+    """ Анонимные запросы не отслеживаются и всегда читают с реплики """
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    # Импорт здесь: роутер авторизации сам зависит от get_db
+    from app.routers.auth import token_user_id
+
+    return token_user_id(token)
+
+
+def mark_write(key: int) -> None:
+    now = time.monotonic()
+    if len(_recent_writes) >= _RECENT_WRITES_LIMIT:
+        for stale in [k for k, written_at in _recent_writes.items() if now - written_at > READ_YOUR_WRITES_SECONDS]:
+            del _recent_writes[stale]
+    _recent_writes[key] = now
+
+
+def wrote_recently(key: int | None) -> bool:
+    if key is None:
+        return False
+    written_at = _recent_writes.get(key)
+    return written_at is not None and time.monotonic() - written_at <= READ_YOUR_WRITES_SECONDS
+
+
+def reads_own_writes(request: Request) -> bool:
+    """ Автор недавней записи: его чтения идут на основной сервер и в обход общего кэша ответов """
+    return wrote_recently(_writer_key(request))
+
+
+@event.listens_for(Session, 'after_commit')
+def _remember_write(session: Session) -> None:
+    key = session.info.get('writer_key')
+    if key is not None:
+        mark_write(key)
+
+
+async def get_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    async with async_session_marker(info={'writer_key': _writer_key(request)}) as session:
         yield session
 
+
+async def get_read_db(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """ Сессия реплики для безопасных запросов; свои записи видны, только пока запросы идут в тот же воркер """
+    # Отметки о записи живут в памяти процесса: запрос, попавший в другой воркер, может прочитать
+    # реплику с отставанием
+    key = _writer_key(request)
+    if request.method not in _SAFE_METHODS or wrote_recently(key):
+        session_marker = async_session_marker
+    else:
+        session_marker = async_read_session_marker
+    async with session_marker(info={'writer_key': key}) as session:
+        yield session
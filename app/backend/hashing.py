@@ -0,0 +1,144 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+# Модуль импортируется в дочерних процессах пула, поэтому держим его без зависимостей от приложения
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_EXECUTOR = os.environ.get('PASSWORD_HASH_EXECUTOR', 'thread')
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', os.cpu_count() or 2))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', PASSWORD_HASH_WORKERS))
+PASSWORD_HASH_MAX_QUEUE = int(os.environ.get('PASSWORD_HASH_MAX_QUEUE', 256))
+# Сколько паролей пакетного создания хэшируется одной задачей пула: меньше накладных расходов на передачу в процесс
+PASSWORD_HASH_CHUNK = int(os.environ.get('PASSWORD_HASH_CHUNK', 8))
+# Оценка длительности проверки до первых замеров: около 0.25 с при стоимости 12, удваивается с каждым раундом
+PASSWORD_VERIFY_ESTIMATE = float(os.environ.get('PASSWORD_VERIFY_ESTIMATE', 0.25 * 2 ** (BCRYPT_ROUNDS - 12)))
+
+# min/max rounds совпадают с текущей стоимостью: любой хэш с другой стоимостью будет перехэширован при входе
+bcrypt_context = CryptContext(
+    schemes=['bcrypt'], deprecated='auto',
+    bcrypt__rounds=BCRYPT_ROUNDS, bcrypt__min_rounds=BCRYPT_ROUNDS, bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+
+def _hash(password: str) -> str:
+    return bcrypt_context.hash(password)
+
+
+def _hash_many(passwords: list[str]) -> list[str]:
+    return [bcrypt_context.hash(password) for password in passwords]
+
+
+def _verify_and_update(password: str, hashed_password: str) -> tuple[bool, str | None]:
+    return bcrypt_context.verify_and_update(password, hashed_password)
+
+
+class HashQueueFull(Exception):
+    pass
+
+
+class PasswordHasher:
+    """ Хэширование паролей в пуле потоков или процессов с ограничением параллелизма """
+    def __init__(self, executor: str = PASSWORD_HASH_EXECUTOR, workers: int = PASSWORD_HASH_WORKERS,
+                 concurrency: int = PASSWORD_HASH_CONCURRENCY, max_queue: int = PASSWORD_HASH_MAX_QUEUE):
+        if executor not in ('thread', 'process'):
+            raise ValueError(f'Unknown password hash executor: {executor}')
+        self.executor_kind = executor
+        self.workers = workers
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self.queued = 0
+        self.running = 0
+        self.max_queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.busy_seconds = 0.0
+        self.verify_seconds = PASSWORD_VERIFY_ESTIMATE
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == 'process':
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='password-hash')
+        return self._executor
+
+    async def _run(self, func, *args):
+        if self.max_queue and self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HashQueueFull()
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        self.running += 1
+        started = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+        finally:
+            self.busy_seconds += time.perf_counter() - started
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def hash_many(self, passwords: list[str], chunk: int = PASSWORD_HASH_CHUNK) -> list[str]:
+        """ Хэши в исходном порядке; в очереди одновременно не больше concurrency задач, так что входы не голодают """
+        chunks = [passwords[start:start + chunk] for start in range(0, len(passwords), chunk)]
+        results: list[list[str]] = [[] for _ in chunks]
+        pending = iter(range(len(chunks)))
+
+        async def worker():
+            for index in pending:
+                results[index] = await self._run(_hash_many, chunks[index])
+
+        # При ошибке одной задачи TaskGroup отменяет остальные, незапущенные пачки не отправляются в пул;
+        # наружу отдается исходное исключение, чтобы HashQueueFull по-прежнему превращался в 503
+        try:
+            async with asyncio.TaskGroup() as group:
+                for _ in range(min(self.concurrency, len(chunks))):
+                    group.create_task(worker())
+        except ExceptionGroup as exc:
+            raise exc.exceptions[0]
+        return [hashed for result in results for hashed in result]
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> tuple[bool, str | None]:
+        """ Проверка пароля; второй элемент - новый хэш, если сменились параметры стоимости """
+        started = time.perf_counter()
+        result = await self._run(_verify_and_update, password, hashed_password)
+        # Скользящее среднее времени ответа, вместе с ожиданием в очереди
+        self.verify_seconds += (time.perf_counter() - started - self.verify_seconds) * 0.1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            'executor': self.executor_kind,
+            'workers': self.workers,
+            'concurrency': self.concurrency,
+            'rounds': BCRYPT_ROUNDS,
+            'queued': self.queued,
+            'running': self.running,
+            'max_queued': self.max_queued,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'busy_seconds': round(self.busy_seconds, 3),
+            'verify_seconds_avg': round(self.verify_seconds, 4),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,179 @@
+import logging
+import os
+import time
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.backend.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Запросы дольше порога пишутся в лог вместе с обезличенными параметрами
+SLOW_QUERY_SECONDS = float(os.environ.get('SLOW_QUERY_MS', 200)) / 1000
+_STATEMENT_LOG_LIMIT = 1000
+
+db_queries = registry.counter('db_queries_total', 'SQL statements executed', ('engine',))
+db_query_seconds = registry.histogram('db_query_duration_seconds', 'SQL statement execution time', ('engine',))
+db_slow_queries = registry.counter('db_slow_queries_total', 'SQL statements slower than SLOW_QUERY_MS', ('engine',))
+
+
+class QueryStats:
+    """ Счетчики SQL в рамках одного HTTP-запроса """
+    __slots__ = ('count', 'seconds', 'slowest_seconds', 'slowest_statement')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement: str | None = None
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.seconds += elapsed
+        if elapsed > self.slowest_seconds:
+            self.slowest_seconds = elapsed
+            self.slowest_statement = statement
+
+    def server_timing(self) -> str:
+        value = f'db;dur={self.seconds * 1000:.2f};desc="{self.count} queries"'
+        if self.count:
+            value += f', db-slowest;dur={self.slowest_seconds * 1000:.2f}'
+        return value
+
+
+# Контекст копируется в гринлет SQLAlchemy, поэтому хуки курсора видят статистику своего запроса
+query_stats: ContextVar[QueryStats | None] = ContextVar('query_stats', default=None)
+
+
+def redact(parameters) -> object:
+    """ Параметры без значений: только типы, чтобы в лог не попали пароли и персональные данные """
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            # executemany: достаточно числа строк и формы первой из них
+            return f'{len(parameters)} rows of {redact(parameters[0])}'
+        return tuple(type(value).__name__ for value in parameters)
+    return type(parameters).__name__
+
+
+def instrument_engine(engine: AsyncEngine, name: str) -> None:
+    """ Подписывает хуки курсора на синхронный движок, который стоит за асинхронным """
+    labels = (name,)
+
+    @event.listens_for(engine.sync_engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine.sync_engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        db_queries.inc(labels)
+        db_query_seconds.observe(elapsed, labels)
+        stats = query_stats.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+        if elapsed >= SLOW_QUERY_SECONDS:
+            db_slow_queries.inc(labels)
+            logger.warning('Slow query on %s engine (%.1f ms): %s; parameters: %s',
+                           name, elapsed * 1000, statement[:_STATEMENT_LOG_LIMIT], redact(parameters))
+
+    @event.listens_for(engine.sync_engine, 'handle_error')
+    def _error(exception_context):
+        # Упавший запрос не доходит до after_cursor_execute, отметку времени надо снять
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('query_started'):
+            conn.info['query_started'].pop()
+
+
+class QueryTimingMiddleware:
+    """ ASGI-middleware: собирает статистику SQL запроса и отдает ее в заголовке Server-Timing """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = query_stats.set(stats)
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', stats.server_timing().encode()))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            query_stats.reset(token)
+
+
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+http_requests_in_flight = registry.gauge('http_requests_in_flight', 'Requests being processed', ('method',))
+http_request_seconds = registry.histogram(
+    'http_request_duration_seconds', 'Request latency by route template', ('router', 'method', 'route'),
+)
+http_response_bytes = registry.histogram(
+    'http_response_size_bytes', 'Response body size by route template', ('router', 'method', 'route'), SIZE_BUCKETS,
+)
+http_responses = registry.counter(
+    'http_responses_total', 'Responses by route template and status', ('router', 'method', 'route', 'status'),
+)
+
+_UNMATCHED = ('', '<unmatched>')
+# Метки маршрута вычисляются один раз на объект маршрута
+_route_labels: dict[int, tuple[str, str]] = {}
+
+
+def _labels_for(route) -> tuple[str, str]:
+    if route is None:
+        return _UNMATCHED
+    labels = _route_labels.get(id(route))
+    if labels is None:
+        tags = getattr(route, 'tags', None)
+        labels = _route_labels[id(route)] = (str(tags[0]) if tags else '', route.path)
+    return labels
+
+
+class RequestMetricsMiddleware:
+    """ ASGI-middleware: задержка, размер ответа и статусы по шаблону маршрута, запросы в работе """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        in_flight = (method,)
+        # [статус, байт тела]; статус 500, если приложение упало до начала ответа
+        response = [500, 0]
+
+        async def send_with_metrics(message):
+            if message['type'] == 'http.response.start':
+                response[0] = message['status']
+            elif message['type'] == 'http.response.body':
+                response[1] += len(message.get('body', b''))
+            await send(message)
+
+        http_requests_in_flight.inc(in_flight)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec(in_flight)
+            # Шаблон пути известен только после маршрутизации: роутер кладет маршрут в scope
+            router, route = _labels_for(scope.get('route'))
+            labels = (router, method, route)
+            http_request_seconds.observe(elapsed, labels)
+            http_response_bytes.observe(response[1], labels)
+            http_responses.inc((router, method, route, response[0]))
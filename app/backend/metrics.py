@@ -0,0 +1,136 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + '}'
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric(ABC):
+    """ Метрика в формате Prometheus: подклассы отдают выборки (имя, метки, значение) """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    @abstractmethod
+    def samples(self) -> Iterable[tuple[str, str, float]]:
+        ...
+
+    def render(self) -> list[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for name, labels, value in self.samples():
+            lines.append(f'{name}{labels} {_format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    """ Монотонный счетчик; значения лежат в словаре по кортежу меток """
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield self.name, _format_labels(self.labels, labels), value
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, labels: tuple = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self.values[labels] = value
+
+
+class CallbackGauge(Metric):
+    """ Значения читаются в момент выгрузки: callback возвращает {кортеж меток: значение} """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str], callback: Callable[[], dict]):
+        super().__init__(name, documentation, labels)
+        self.callback = callback
+
+    def samples(self):
+        for labels, value in self.callback().items():
+            yield self.name, _format_labels(self.labels, labels), value
+
+
+class Histogram(Metric):
+    """ Гистограмма с фиксированными границами: на наблюдение - bisect и два сложения """
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        series = self.series.get(labels)
+        if series is None:
+            # Счетчики по корзинам (последняя - +Inf) и сумма наблюдений
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else repr(float(bound))
+                yield f'{self.name}_bucket', _format_labels((*self.labels, 'le'), (*labels, le)), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labels, labels), total
+            yield f'{self.name}_count', _format_labels(self.labels, labels), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        """ Текстовый формат Prometheus (exposition format 0.0.4) """
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
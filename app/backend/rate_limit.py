@@ -0,0 +1,103 @@
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# Скорость пополнения в попытках в минуту и емкость корзины; 0 отключает ограничение.
+# Корзины хранятся в памяти процесса: при --workers N допустимая частота в N раз выше заданной,
+# для общего лимита нужна реализация RateLimitStore поверх общего хранилища (например, Redis)
+LOGIN_RATE_PER_USERNAME = float(os.environ.get('LOGIN_RATE_PER_USERNAME', 5))
+LOGIN_BURST_PER_USERNAME = int(os.environ.get('LOGIN_BURST_PER_USERNAME', 10))
+LOGIN_RATE_PER_IP = float(os.environ.get('LOGIN_RATE_PER_IP', 30))
+LOGIN_BURST_PER_IP = int(os.environ.get('LOGIN_BURST_PER_IP', 60))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100_000))
+
+
+class RateLimitStore(ABC):
+    """ Хранилище корзин токенов; take и peek возвращают 0, если попытка разрешена, иначе сколько секунд ждать """
+    @abstractmethod
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        ...
+
+    @abstractmethod
+    async def peek(self, key: str, rate: float, burst: int) -> float:
+        """ То же, что take, но без списания попытки """
+        ...
+
+
+class MemoryRateLimitStore(RateLimitStore):
+    """ Корзины в памяти процесса: лимит действует на каждый воркер отдельно """
+    def __init__(self, maxsize: int = RATE_LIMIT_MAX_KEYS):
+        self.maxsize = maxsize
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    def _tokens(self, key: str, rate: float, burst: int, now: float) -> float:
+        tokens, updated_at = self._buckets.get(key, (burst, now))
+        # Корзина пополняется непрерывно, поэтому окно скользящее, без скачков на границе минуты
+        return min(burst, tokens + (now - updated_at) * rate)
+
+    async def peek(self, key: str, rate: float, burst: int) -> float:
+        tokens = self._tokens(key, rate, burst, time.monotonic())
+        return 0.0 if tokens >= 1 else (1 - tokens) / rate
+
+    async def take(self, key: str, rate: float, burst: int) -> float:
+        now = time.monotonic()
+        tokens = self._tokens(key, rate, burst, now)
+        self._buckets.pop(key, None)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        # Вытесняются давно не использованные корзины: к этому времени они все равно полные
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+class TokenBucketLimiter:
+    """ Ограничение частоты по ключу алгоритмом корзины токенов """
+    def __init__(self, store: RateLimitStore, per_minute: float, burst: int):
+        self.store = store
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.allowed = 0
+        self.limited = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0 and self.burst > 0
+
+    async def check(self, key: str) -> float:
+        """ Проверяет, есть ли попытка, не списывая ее; 0 - разрешено, иначе через сколько секунд повторить """
+        if not self.enabled:
+            return 0.0
+        retry_after = await self.store.peek(key, self.rate, self.burst)
+        if retry_after:
+            self.limited += 1
+        return retry_after
+
+    async def hit(self, key: str) -> float:
+        """ Списывает попытку; 0 - разрешено, иначе через сколько секунд повторить """
+        if not self.enabled:
+            return 0.0
+        retry_after = await self.store.take(key, self.rate, self.burst)
+        if retry_after:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+    def stats(self) -> dict:
+        return {
+            'per_minute': round(self.rate * 60, 3),
+            'burst': self.burst,
+            'allowed': self.allowed,
+            'limited': self.limited,
+        }
+
+
+login_store = MemoryRateLimitStore()
+login_ip_limiter = TokenBucketLimiter(login_store, LOGIN_RATE_PER_IP, LOGIN_BURST_PER_IP)
+login_username_limiter = TokenBucketLimiter(login_store, LOGIN_RATE_PER_USERNAME, LOGIN_BURST_PER_USERNAME)
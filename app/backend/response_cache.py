@@ -0,0 +1,155 @@
+import hashlib
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Iterable
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette import status
+
+from app.backend.cache import TTLCache
+from app.backend.db_depends import reads_own_writes
+from app.backend.serialization import RawJSONResponse
+
+RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 60))
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL')
+
+
+class CacheBackend(ABC):
+    """ Хранилище закэшированных ответов и поколений пространств имен """
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        ...
+
+    @abstractmethod
+    async def generations(self, namespaces: Iterable[str]) -> list[int]:
+        ...
+
+    @abstractmethod
+    async def bump(self, namespace: str) -> None:
+        ...
+
+
+class MemoryBackend(CacheBackend):
+    """ LRU в памяти процесса: поколения локальны для воркера, расхождение ограничено TTL """
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.entries = TTLCache(maxsize=maxsize)
+        self._generations: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        return self.entries.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.entries.set(key, value, ttl=ttl)
+
+    async def generations(self, namespaces: Iterable[str]) -> list[int]:
+        return [self._generations.get(namespace, 0) for namespace in namespaces]
+
+    async def bump(self, namespace: str) -> None:
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+
+class RedisBackend(CacheBackend):
+    """ Общий для всех воркеров кэш в Redis, требует пакет redis """
+    prefix = 'response-cache'
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as redis
+        except ImportError:
+            raise RuntimeError('RESPONSE_CACHE_URL requires the redis package to be installed')
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._redis.get(f'{self.prefix}:entry:{key}')
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self._redis.set(f'{self.prefix}:entry:{key}', value, ex=ttl)
+
+    async def generations(self, namespaces: Iterable[str]) -> list[int]:
+        values = await self._redis.mget([f'{self.prefix}:generation:{namespace}' for namespace in namespaces])
+        return [int(value or 0) for value in values]
+
+    async def bump(self, namespace: str) -> None:
+        await self._redis.incr(f'{self.prefix}:generation:{namespace}')
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+
+class ResponseCache:
+    """ Кэш JSON-ответов с ETag; записи инвалидируются увеличением поколения пространства имен """
+    def __init__(self, backend: CacheBackend, ttl: int = RESPONSE_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.bypassed = 0
+
+    async def _key(self, request: Request, namespaces: tuple[str, ...]) -> str:
+        generations = await self.backend.generations(namespaces)
+        query = '&'.join(sorted(f'{name}={value}' for name, value in request.query_params.multi_items()))
+        versions = ','.join(f'{namespace}:{generation}' for namespace, generation in zip(namespaces, generations))
+        return f'{request.url.path}?{query}|{versions}'
+
+    async def respond(self, request: Request, namespaces: tuple[str, ...], build: Callable[[], Awaitable[Any]],
+                      encode: Callable[[Any], bytes] | None = None) -> Response:
+        """ Ответ из кэша или результат build(), закодированный encode(); 304, если ETag клиента совпал """
+        if reads_own_writes(request):
+            # Кэш общий для всех: запись, собранная чужим запросом с отстающей реплики уже после нашей записи,
+            # вернула бы автору старые данные, поэтому в окне read-your-writes кэш не читается и не пополняется
+            self.bypassed += 1
+            body, etag = self._render(await build(), encode)
+            return self._response(request, body, etag)
+
+        key = await self._key(request, namespaces)
+        entry = await self.backend.get(key)
+        if entry is None:
+            self.misses += 1
+            body, etag = self._render(await build(), encode)
+            await self.backend.set(key, etag.encode() + b'\n' + body, self.ttl)
+        else:
+            self.hits += 1
+            etag, body = entry.split(b'\n', 1)
+            etag = etag.decode()
+        return self._response(request, body, etag)
+
+    @staticmethod
+    def _render(result: Any, encode: Callable[[Any], bytes] | None) -> tuple[bytes, str]:
+        body = encode(result) if encode is not None else JSONResponse(jsonable_encoder(result)).body
+        return body, f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+    def _response(self, request: Request, body: bytes, etag: str) -> Response:
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if _etag_matches(request.headers.get('if-none-match'), etag):
+            self.not_modified += 1
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return RawJSONResponse(body, headers=headers)
+
+    async def bump(self, *namespaces: str) -> None:
+        for namespace in namespaces:
+            await self.backend.bump(namespace)
+
+    def stats(self) -> dict:
+        return {
+            'backend': type(self.backend).__name__,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'not_modified': self.not_modified,
+            'bypassed': self.bypassed,
+        }
+
+
+response_cache = ResponseCache(RedisBackend(RESPONSE_CACHE_URL) if RESPONSE_CACHE_URL else MemoryBackend())
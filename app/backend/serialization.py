@@ -0,0 +1,22 @@
+from typing import Any
+
+from fastapi import Response
+from pydantic import TypeAdapter
+
+
+class RawJSONResponse(Response):
+    """ Ответ с уже готовыми байтами JSON, без повторного кодирования """
+    media_type = 'application/json'
+
+
+class SchemaEncoder:
+    """ Кодирование в JSON по заранее собранной схеме pydantic, без обхода jsonable_encoder """
+    def __init__(self, schema: Any):
+        self.adapter = TypeAdapter(schema)
+
+    def __call__(self, value: Any) -> bytes:
+        # Валидация и сериализация идут в pydantic-core; from_attributes позволяет передавать объекты ORM
+        return self.adapter.dump_json(self.adapter.validate_python(value, from_attributes=True), exclude_unset=True)
+
+    def response(self, value: Any, status_code: int = 200) -> RawJSONResponse:
+        return RawJSONResponse(self(value), status_code=status_code)
@@ -0,0 +1,97 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Hashable
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.backend.cache import TTLCache
+from app.backend.category_rollup import rollup_refresher
+from app.backend.response_cache import response_cache
+
+# 0 - только объединение одновременных запросов; больше 0 - результат еще и живет столько секунд
+SINGLEFLIGHT_TTL = float(os.environ.get('SINGLEFLIGHT_TTL', 0))
+SINGLEFLIGHT_CACHE_SIZE = int(os.environ.get('SINGLEFLIGHT_CACHE_SIZE', 4096))
+
+_MISSING = object()
+
+
+def detached_session(db: AsyncSession) -> AsyncSession:
+    """ Сессия с тем же движком, что у запроса (реплика или основной), но со своим временем жизни """
+    return AsyncSession(db.bind, expire_on_commit=False)
+
+
+class SingleFlight:
+    """ Одинаковые одновременные загрузки выполняются один раз, остальные вызовы ждут общий результат """
+    def __init__(self, ttl: float = SINGLEFLIGHT_TTL, maxsize: int = SINGLEFLIGHT_CACHE_SIZE):
+        self.ttl = ttl
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        self._results = TTLCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else None
+        # Номер очистки: загрузка, начатая до clear(), не сохраняет свой результат
+        self._generation = 0
+        self.calls = 0
+        self.executions = 0
+        self.collapsed = 0
+        self.cached = 0
+
+    async def do(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        """ load() не должен пользоваться сессией запроса: ее закроют, когда первый запрос завершится """
+        self.calls += 1
+        if self._results is not None:
+            result = self._results.get(key, _MISSING)
+            if result is not _MISSING:
+                self.cached += 1
+                return result
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._run(key, load))
+        else:
+            self.collapsed += 1
+        # Отмена одного из ожидающих (клиент отключился) не отменяет общую загрузку
+        return await asyncio.shield(task)
+
+    async def _run(self, key: Hashable, load: Callable[[], Awaitable[Any]]) -> Any:
+        generation = self._generation
+        try:
+            result = await load()
+            if self._results is not None and generation == self._generation:
+                self._results.set(key, result)
+            return result
+        finally:
+            # После clear() под этим ключом может выполняться уже новая загрузка: ее запись не трогаем
+            if self._inflight.get(key) is asyncio.current_task():
+                del self._inflight[key]
+
+    def clear(self) -> None:
+        """ Новые вызовы не присоединяются к загрузкам, начатым до очистки, и не получают их результат """
+        self._generation += 1
+        self._inflight.clear()
+        if self._results is not None:
+            self._results.clear()
+
+    def stats(self) -> dict:
+        return {
+            'ttl': self.ttl,
+            'in_flight': len(self._inflight),
+            'calls': self.calls,
+            'executions': self.executions,
+            'collapsed': self.collapsed,
+            'cached': self.cached,
+        }
+
+
+# Пути записи очищают результаты вместе со сбросом кэша ответов, иначе при SINGLEFLIGHT_TTL > 0
+# после изменения еще ttl секунд отдавались бы старые данные
+product_flight = SingleFlight()
+category_flight = SingleFlight()
+review_flight = SingleFlight()
+
+
+async def invalidate_products(rollups: bool = True) -> None:
+    """ После записи в товары или отзывы: сброс загрузок, кэша ответов и пометка агрегатов категорий """
+    product_flight.clear()
+    review_flight.clear()
+    await response_cache.bump('product')
+    if rollups:
+        rollup_refresher.mark_dirty()
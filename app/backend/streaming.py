@@ -0,0 +1,121 @@
+import codecs
+import csv
+import io
+import json
+import os
+import zlib
+from decimal import Decimal
+from typing import Any, AsyncIterator, Iterable, Mapping
+
+from fastapi import Request
+
+CSV_MEDIA_TYPES = ('text/csv', 'application/csv')
+# Предел длины строки импорта в символах: без него одна строка без переводов читается в память целиком
+MAX_LINE_LENGTH = int(os.environ.get('BULK_MAX_LINE_LENGTH', 1_048_576))
+
+
+class LineTooLong(Exception):
+    def __init__(self, line: int, limit: int):
+        super().__init__(f'Line {line} is longer than {limit} characters')
+        self.line = line
+        self.limit = limit
+
+
+def request_format(request: Request) -> str:
+    content_type = request.headers.get('content-type', '').split(';')[0].strip().lower()
+    return 'csv' if content_type in CSV_MEDIA_TYPES else 'ndjson'
+
+
+async def iter_lines(request: Request, max_length: int = MAX_LINE_LENGTH) -> AsyncIterator[str]:
+    """ Построчное чтение тела запроса без загрузки его целиком в память """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    tail = ''
+    number = 0
+    async for chunk in request.stream():
+        lines = (tail + decoder.decode(chunk)).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            number += 1
+            if len(line) > max_length:
+                raise LineTooLong(number, max_length)
+            yield line.rstrip('\r')
+        # Незаконченная строка проверяется сразу, не дожидаясь ее конца
+        if len(tail) > max_length:
+            raise LineTooLong(number + 1, max_length)
+    tail += decoder.decode(b'', final=True)
+    if tail:
+        yield tail.rstrip('\r')
+
+
+async def iter_records(request: Request) -> AsyncIterator[tuple[int, dict | None, str | None]]:
+    """ Записи CSV (с заголовком, одна запись на строку) или NDJSON: (номер строки, запись, ошибка) """
+    fmt = request_format(request)
+    header: list[str] | None = None
+    line_number = 0
+    async for line in iter_lines(request):
+        line_number += 1
+        if not line.strip():
+            continue
+        if fmt == 'csv':
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                yield line_number, None, f'Expected {len(header)} columns, got {len(values)}'
+                continue
+            # Пустая ячейка в CSV означает отсутствие значения
+            yield line_number, {name: value for name, value in zip(header, values) if value != ''}, None
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, f'Invalid JSON: {exc}'
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, 'Expected a JSON object'
+                continue
+            yield line_number, record, None
+
+
+def _json_default(value: Any):
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def encode_ndjson(rows: Iterable[Mapping]) -> bytes:
+    return ''.join(json.dumps(dict(row), default=_json_default, ensure_ascii=False) + '\n' for row in rows).encode()
+
+
+def encode_csv(rows: Iterable[Mapping], columns: list[str], header: bool = False) -> bytes:
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    if header:
+        writer.writerow(columns)
+    writer.writerows([row[column] for column in columns] for row in rows)
+    return output.getvalue().encode()
+
+
+async def encode_stream(partitions: AsyncIterator[list[Mapping]], fmt: str, columns: list[str],
+                        compress: bool = False) -> AsyncIterator[bytes]:
+    """ Кодирование пачек строк в NDJSON или CSV с необязательным gzip на лету """
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16) if compress else None
+    first = True
+    async for rows in partitions:
+        if fmt == 'csv':
+            chunk = encode_csv(rows, columns, header=first)
+        else:
+            chunk = encode_ndjson(rows)
+        first = False
+        if compressor is not None:
+            chunk = compressor.compress(chunk)
+        if chunk:
+            yield chunk
+    if fmt == 'csv' and first:
+        chunk = encode_csv([], columns, header=True)
+        yield compressor.compress(chunk) if compressor is not None else chunk
+    if compressor is not None:
+        yield compressor.flush()
@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.backend.db import async_session_marker
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Как часто воркер узнает об эпохах, сдвинутых в других процессах
+TOKEN_EPOCH_POLL_SECONDS = float(os.environ.get('TOKEN_EPOCH_POLL_SECONDS', 1))
+# Запас на транзакции, которые сдвинули эпоху до предыдущего опроса, а зафиксировались после него
+TOKEN_EPOCH_POLL_OVERLAP = float(os.environ.get('TOKEN_EPOCH_POLL_OVERLAP', 10))
+
+# Последняя известная воркеру эпоха токенов пользователя: токены с меньшей эпохой отклоняются без запроса к базе
+token_epochs: dict[int, int] = {}
+
+
+def revoke_user(user_id: int, token_epoch: int) -> None:
+    """ Токены пользователя с эпохой меньше token_epoch перестают приниматься сразу, не дожидаясь exp """
+    if token_epoch > token_epochs.get(user_id, 0):
+        token_epochs[user_id] = token_epoch
+
+
+def next_epoch() -> dict:
+    """ Значения для UPDATE пользователя, после которого его выданные токены больше не принимаются """
+    return {'token_epoch': User.token_epoch + 1, 'token_epoch_changed_at': func.now()}
+
+
+class TokenEpochPoller:
+    """ Фоновое чтение эпох, сдвинутых другими воркерами; lookback - сколько секунд истории читать при старте """
+    def __init__(self, lookback: float, interval: float = TOKEN_EPOCH_POLL_SECONDS,
+                 overlap: float = TOKEN_EPOCH_POLL_OVERLAP):
+        self.lookback = lookback
+        self.interval = interval
+        self.overlap = overlap
+        # Время базы на момент предыдущего опроса: часы воркеров в сравнении не участвуют
+        self._polled_at: datetime | None = None
+        self.polls = 0
+        self.revoked = 0
+        self.poll_seconds = 0.0
+        self._task: asyncio.Task | None = None
+
+    async def poll(self) -> bool:
+        started = time.perf_counter()
+        window = timedelta(seconds=self.lookback if self._polled_at is None else self.overlap)
+        try:
+            async with async_session_marker() as db:
+                now = await db.scalar(select(func.now()))
+                since = (self._polled_at or now) - window
+                rows = (await db.execute(select(User.id, User.token_epoch)
+                                         .where(User.token_epoch_changed_at > since))).all()
+        except (SQLAlchemyError, OSError):
+            logger.warning('Token epoch poll failed', exc_info=True)
+            return False
+        for user_id, token_epoch in rows:
+            if token_epoch > token_epochs.get(user_id, 0):
+                self.revoked += 1
+            revoke_user(user_id, token_epoch)
+        self._polled_at = now
+        self.polls += 1
+        self.poll_seconds += time.perf_counter() - started
+        return True
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.poll()
+            except Exception:
+                # Непредвиденная ошибка не должна останавливать задачу: опрос повторится в следующий интервал
+                logger.exception('Token epoch poll crashed')
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> dict:
+        return {
+            'interval': self.interval,
+            'polls': self.polls,
+            'revoked': self.revoked,
+            'known_users': len(token_epochs),
+            'poll_seconds_total': round(self.poll_seconds, 6),
+        }
@@ -0,0 +1,223 @@
+"""
+Запуск приложения в нескольких процессах: python -m app --workers 4 --db-connections 80
+
+Без --preload воркеры запускает uvicorn (spawn, каждый импортирует приложение сам).
+С --preload родитель импортирует приложение и прогревает движки до fork, а воркеры
+наследуют уже загруженные модули и инициализированный диалект базы.
+"""
+import argparse
+import asyncio
+import importlib.util
+import logging
+import logging.config
+import os
+import signal
+import sys
+import time
+from collections import deque
+
+import uvicorn
+from dotenv import load_dotenv
+from uvicorn.config import LOGGING_CONFIG
+
+load_dotenv()
+
+logger = logging.getLogger('uvicorn.error')
+
+# Общий лимит соединений с базой на все воркеры; 0 - размеры пула задаются DB_POOL_SIZE и DB_MAX_OVERFLOW
+DB_MAX_CONNECTIONS = int(os.environ.get('DB_MAX_CONNECTIONS', 0))
+
+# Код выхода uvicorn, если приложение не смогло стартовать (lifespan упал)
+STARTUP_FAILURE = 3
+# Воркер, упавший быстрее этого, перезапускается с паузой, чтобы не крутить fork в цикле
+RESTART_BACKOFF_SECONDS = 1.0
+# Больше перезапусков за окно - воркеры падают циклически: останавливаем все и выходим с ошибкой
+MAX_RESTARTS = int(os.environ.get('WORKER_MAX_RESTARTS', 10))
+RESTART_WINDOW_SECONDS = float(os.environ.get('WORKER_RESTART_WINDOW', 60))
+CRASH_LOOP = 1
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+
+
+def pool_budget(total: int, workers: int) -> tuple[int, int]:
+    """ pool_size и max_overflow на воркер: все воркеры вместе открывают не больше total соединений """
+    per_worker = total // workers
+    if per_worker < 1:
+        raise ValueError(f'{total} connections are not enough for {workers} workers')
+    # Половина держится открытой постоянно, остальное - запас на всплески
+    pool_size = max(1, per_worker // 2)
+    return pool_size, per_worker - pool_size
+
+
+def configure_environment(args: argparse.Namespace) -> None:
+    """ Настройки читаются модулями приложения при импорте, поэтому выставляются до него и наследуются воркерами """
+    if args.db_connections:
+        pool_size, max_overflow = pool_budget(args.db_connections, args.workers)
+        # Реплика берет те же значения через EngineSettings.from_env('DB_READ_', base)
+        os.environ['DB_POOL_SIZE'] = str(pool_size)
+        os.environ['DB_MAX_OVERFLOW'] = str(max_overflow)
+        logger.info('DB pool per worker: pool_size=%d, max_overflow=%d', pool_size, max_overflow)
+    # Пул хэширования создается в каждом воркере: делим ядра, а не умножаем процессы на их число
+    if 'PASSWORD_HASH_WORKERS' not in os.environ:
+        os.environ['PASSWORD_HASH_WORKERS'] = str(max(1, (os.cpu_count() or 1) // args.workers))
+
+
+def check_optional(args: argparse.Namespace, parser: argparse.ArgumentParser) -> None:
+    for option, module in (('loop', 'uvloop'), ('http', 'httptools')):
+        if getattr(args, option) == module and importlib.util.find_spec(module) is None:
+            parser.error(f'--{option} {module} requires the {module} package: pip install {module}')
+
+
+async def warm_up() -> None:
+    """ Первое подключение инициализирует диалект; после dispose воркеры откроют свои соединения """
+    from sqlalchemy import text
+
+    from app.backend.db import engine, read_engine
+
+    for item in {engine, read_engine}:
+        async with item.connect() as conn:
+            await conn.execute(text('SELECT 1'))
+        await item.dispose()
+
+
+def _run_worker(config: uvicorn.Config, sockets: list) -> None:
+    # Своя группа процессов: Ctrl+C в терминале получает только родитель и один раз передает SIGTERM,
+    # иначе повторный сигнал от родителя uvicorn воспринял бы как принудительную остановку
+    os.setpgid(0, 0)
+    for signum in STOP_SIGNALS:
+        signal.signal(signum, signal.SIG_DFL)
+    # Сигналы заблокированы родителем на время fork; снимаем блокировку, когда обработчики уже сброшены
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+    server = uvicorn.Server(config)
+    try:
+        server.run(sockets=sockets)
+    except BaseException:
+        logger.exception('Worker %d crashed', os.getpid())
+        os._exit(1)
+    os._exit(0 if server.started else STARTUP_FAILURE)
+
+
+def serve_preloaded(config: uvicorn.Config, workers: int) -> int:
+    """ Родитель держит сокет и следит за воркерами: перезапускает упавшие, по сигналу останавливает все """
+    config.load()
+    asyncio.run(warm_up())
+    if workers == 1:
+        server = uvicorn.Server(config)
+        server.run()
+        return 0 if server.started else STARTUP_FAILURE
+
+    sock = config.bind_socket()
+    children: dict[int, float] = {}
+    restarts: deque[float] = deque()
+    stopping = False
+    exit_code = 0
+
+    def spawn() -> None:
+        # Сигнал между fork и записью в children оставил бы воркер без SIGTERM, а в дочернем процессе
+        # до сброса обработчиков вызвал бы stop() родителя, поэтому на это время сигналы блокируются
+        previous = signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        try:
+            if stopping:
+                return
+            pid = os.fork()
+            if pid == 0:
+                _run_worker(config, [sock])
+            children[pid] = time.monotonic()
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, previous)
+        logger.info('Started worker %d', pid)
+
+    def stop(signum=None, frame=None) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    previous = signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+    for signum in STOP_SIGNALS:
+        signal.signal(signum, stop)
+    for _ in range(workers):
+        spawn()
+    signal.pthread_sigmask(signal.SIG_SETMASK, previous)
+
+    while children:
+        pid, status = os.wait()
+        started = children.pop(pid, None)
+        if started is None:
+            continue
+        code = os.waitstatus_to_exitcode(status)
+        if stopping:
+            logger.info('Worker %d stopped', pid)
+            continue
+        if code == STARTUP_FAILURE:
+            logger.error('Worker %d failed to start, shutting down', pid)
+            exit_code = STARTUP_FAILURE
+            stop()
+            continue
+        now = time.monotonic()
+        restarts.append(now)
+        while restarts[0] < now - RESTART_WINDOW_SECONDS:
+            restarts.popleft()
+        if len(restarts) > MAX_RESTARTS:
+            logger.error('Workers restarted %d times in %.0f seconds, shutting down',
+                         len(restarts), RESTART_WINDOW_SECONDS)
+            exit_code = CRASH_LOOP
+            stop()
+            continue
+        logger.warning('Worker %d exited with code %d, restarting', pid, code)
+        if now - started < RESTART_BACKOFF_SECONDS:
+            time.sleep(RESTART_BACKOFF_SECONDS)
+        # spawn() не запускает воркер, если во время паузы пришел сигнал остановки
+        spawn()
+    sock.close()
+    return exit_code
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog='python -m app', description='Run the API with N worker processes')
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 8000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', 1)))
+    parser.add_argument('--loop', choices=('auto', 'asyncio', 'uvloop'), default='auto',
+                        help='event loop; auto picks uvloop when it is installed')
+    parser.add_argument('--http', choices=('auto', 'h11', 'httptools'), default='auto',
+                        help='HTTP parser; auto picks httptools when it is installed')
+    parser.add_argument('--db-connections', type=int, default=DB_MAX_CONNECTIONS,
+                        help='total connection budget for all workers, sets DB_POOL_SIZE and DB_MAX_OVERFLOW')
+    parser.add_argument('--preload', action='store_true',
+                        help='import the app and warm up the engines once, then fork workers')
+    parser.add_argument('--graceful-timeout', type=int, default=30,
+                        help='seconds to finish in-flight requests after SIGTERM')
+    parser.add_argument('--keep-alive', type=int, default=5, help='keep-alive timeout in seconds')
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--forwarded-allow-ips', default=os.environ.get('FORWARDED_ALLOW_IPS'),
+                        help='proxies trusted to set X-Forwarded-For, used by the login rate limit')
+    parser.add_argument('--log-level', default='info')
+    parser.add_argument('--no-access-log', action='store_true')
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.db_connections and args.db_connections < args.workers:
+        parser.error(f'--db-connections {args.db_connections} is less than --workers {args.workers}')
+    if args.preload and not hasattr(os, 'fork'):
+        parser.error('--preload needs os.fork and is not available on this platform')
+    check_optional(args, parser)
+    return args
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    # Та же конфигурация логов, что uvicorn ставит в каждом процессе, чтобы были видны сообщения родителя
+    logging.config.dictConfig(LOGGING_CONFIG)
+    logger.setLevel(args.log_level.upper())
+    configure_environment(args)
+    options = dict(
+        host=args.host, port=args.port, loop=args.loop, http=args.http, backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive, timeout_graceful_shutdown=args.graceful_timeout,
+        forwarded_allow_ips=args.forwarded_allow_ips, log_level=args.log_level, access_log=not args.no_access_log,
+    )
+    if args.preload:
+        sys.exit(serve_preloaded(uvicorn.Config('app.main:app', **options), args.workers))
+    uvicorn.run('app.main:app', workers=args.workers, **options)
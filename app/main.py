@@ -1,8 +1,67 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
-from app.routers import category, product, auth, permission, review
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from starlette import status
+
+from app.backend.batching import BatchQueueFull
+from app.backend.category_rollup import rollup_refresher
+from app.backend.category_tree import category_tree
+from app.backend.db import engine, read_engine
+from app.backend.hashing import HashQueueFull, password_hasher
+from app.backend.instrumentation import QueryTimingMiddleware, RequestMetricsMiddleware, instrument_engine
+from app.backend.streaming import LineTooLong
+from app.routers import category, product, auth, permission, review, monitoring
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await category_tree.refresh()
+    rollup_refresher.start()
+    auth.token_epoch_poller.start()
+    if review.review_queue is not None:
+        review.review_queue.start()
+    yield
+    # Принятые в очередь отзывы записываются до остановки воркера
+    if review.review_queue is not None:
+        await review.review_queue.close()
+    await auth.token_epoch_poller.stop()
+    await rollup_refresher.stop()
+    password_hasher.shutdown()
+
+
+instrument_engine(engine, 'writer')
+if read_engine is not engine:
+    instrument_engine(read_engine, 'reader')
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(QueryTimingMiddleware)
+app.add_middleware(RequestMetricsMiddleware)
+
+@app.exception_handler(HashQueueFull)
+async def hash_queue_full_handler(request: Request, exc: HashQueueFull):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': 'Too many authentication requests, try again later'},
+        headers={'Retry-After': '1'},
+    )
+
+@app.exception_handler(BatchQueueFull)
+async def batch_queue_full_handler(request: Request, exc: BatchQueueFull):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={'detail': 'Too many pending writes, try again later'},
+        headers={'Retry-After': '1'},
+    )
+
+@app.exception_handler(LineTooLong)
+async def line_too_long_handler(request: Request, exc: LineTooLong):
+    # Пачки до этой строки уже записаны: импорт останавливается, а не откатывается целиком
+    return JSONResponse(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        content={'detail': str(exc), 'row': exc.line},
+    )
 
-app = FastAPI()
 @app.get('/')
 async def root() -> dict:
     return {'message': 'My app'}
@@ -11,4 +70,6 @@ app.include_router(category.router)
 app.include_router(product.router)
 app.include_router(auth.router)
 app.include_router(permission.router)
-app.include_router(review.router)
\ No newline at end of file
+app.include_router(review.router)
+app.include_router(monitoring.router)
+app.include_router(monitoring.metrics_router)
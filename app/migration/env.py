@@ -10,7 +10,7 @@ from sqlalchemy.ext.asyncio import async_engine_from_config
 from alembic import context
 
 from app.backend.db import Base
-from app.models import Category, Product, User, Review
+from app.models import Category, Product, User, Review, RefreshTokenRecord
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,46 @@
+"""product rating sum
+
+Revision ID: 7ca4cff15919
+Revises: 8824732d8a30
+Create Date: 2026-10-18 10:12:31.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7ca4cff15919'
+down_revision: Union[str, None] = '8824732d8a30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('product', sa.Column('rating_sum', sa.Integer(), server_default='0', nullable=False))
+    # Заполняем агрегаты по активным отзывам, рейтинг пересчитывается из суммы
+    op.execute("""
+        UPDATE product
+        SET rating_sum = totals.rating_sum,
+            reviews_count = totals.reviews_count,
+            rating = CASE WHEN totals.reviews_count > 0
+                          THEN totals.rating_sum::float / totals.reviews_count
+                          ELSE 0 END
+        FROM (
+            SELECT product.id AS product_id,
+                   coalesce(sum(review.grade), 0) AS rating_sum,
+                   count(review.id) AS reviews_count
+            FROM product
+            LEFT JOIN review ON review.product_id = product.id AND review.is_active
+            GROUP BY product.id
+        ) AS totals
+        WHERE product.id = totals.product_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('product', 'rating_sum')
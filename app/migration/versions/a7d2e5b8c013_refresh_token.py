@@ -0,0 +1,41 @@
+"""refresh token
+
+Revision ID: a7d2e5b8c013
+Revises: f1a6b3c9d254
+Create Date: 2026-10-18 16:41:09.204517
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7d2e5b8c013'
+down_revision: Union[str, None] = 'f1a6b3c9d254'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('refresh_token',
+    sa.Column('jti', sa.String(length=32), nullable=False),
+    sa.Column('family', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('used_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('revoked_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('jti')
+    )
+    op.create_index(op.f('ix_refresh_token_family'), 'refresh_token', ['family'], unique=False)
+    op.create_index(op.f('ix_refresh_token_user_id'), 'refresh_token', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_refresh_token_user_id'), table_name='refresh_token')
+    op.drop_index(op.f('ix_refresh_token_family'), table_name='refresh_token')
+    op.drop_table('refresh_token')
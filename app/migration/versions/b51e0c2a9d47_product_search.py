@@ -0,0 +1,42 @@
+"""product search
+
+Revision ID: b51e0c2a9d47
+Revises: 7ca4cff15919
+Create Date: 2026-10-18 11:02:47.518930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b51e0c2a9d47'
+down_revision: Union[str, None] = '7ca4cff15919'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.add_column('product', sa.Column(
+        'search_vector',
+        postgresql.TSVECTOR(),
+        sa.Computed("setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+                    "setweight(to_tsvector('simple', coalesce(description, '')), 'B')", persisted=True),
+        nullable=True,
+    ))
+    op.create_index('ix_product_search_vector', 'product', ['search_vector'], unique=False,
+                    postgresql_using='gin')
+    op.create_index('ix_product_name_trgm', 'product', ['name'], unique=False,
+                    postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_product_name_trgm', table_name='product')
+    op.drop_index('ix_product_search_vector', table_name='product')
+    op.drop_column('product', 'search_vector')
@@ -0,0 +1,59 @@
+"""category rollup
+
+Revision ID: c4d72e1a9f30
+Revises: e3f9a61c04b8
+Create Date: 2026-10-18 14:20:41.118305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d72e1a9f30'
+down_revision: Union[str, None] = 'e3f9a61c04b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('category_rollup',
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('product_count', sa.Integer(), nullable=False),
+    sa.Column('rating_sum', sa.BigInteger(), nullable=False),
+    sa.Column('reviews_count', sa.Integer(), nullable=False),
+    sa.Column('rating', sa.Float(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('category_id')
+    )
+    # Первичное заполнение: пары (предок, потомок) по активным категориям и агрегаты активных товаров
+    op.execute("""
+        WITH RECURSIVE tree(ancestor_id, category_id) AS (
+            SELECT id, id FROM category WHERE is_active
+            UNION
+            SELECT tree.ancestor_id, category.id
+            FROM category JOIN tree ON category.parent_id = tree.category_id
+            WHERE category.is_active
+        )
+        INSERT INTO category_rollup (category_id, product_count, rating_sum, reviews_count, rating, refreshed_at)
+        SELECT tree.ancestor_id,
+               count(product.id),
+               coalesce(sum(product.rating_sum), 0),
+               coalesce(sum(product.reviews_count), 0),
+               CASE WHEN coalesce(sum(product.reviews_count), 0) > 0
+                    THEN sum(product.rating_sum)::float / sum(product.reviews_count)
+                    ELSE 0 END,
+               now()
+        FROM tree
+        LEFT JOIN product ON product.category_id = tree.category_id AND product.is_active
+        GROUP BY tree.ancestor_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('category_rollup')
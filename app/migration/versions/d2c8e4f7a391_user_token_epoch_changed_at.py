@@ -0,0 +1,30 @@
+"""user token epoch changed at
+
+Revision ID: d2c8e4f7a391
+Revises: a7d2e5b8c013
+Create Date: 2026-10-18 21:14:52.318604
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2c8e4f7a391'
+down_revision: Union[str, None] = 'a7d2e5b8c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user', sa.Column('token_epoch_changed_at', sa.DateTime(timezone=True), nullable=True))
+    op.create_index(op.f('ix_user_token_epoch_changed_at'), 'user', ['token_epoch_changed_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_user_token_epoch_changed_at'), table_name='user')
+    op.drop_column('user', 'token_epoch_changed_at')
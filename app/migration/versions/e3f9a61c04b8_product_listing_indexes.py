@@ -0,0 +1,47 @@
+"""product listing indexes
+
+Revision ID: e3f9a61c04b8
+Revises: b51e0c2a9d47
+Create Date: 2026-10-18 11:48:05.372641
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3f9a61c04b8'
+down_revision: Union[str, None] = 'b51e0c2a9d47'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ACTIVE_IN_STOCK = sa.text('is_active AND stock > 0')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_product_category_price', 'product', ['category_id', 'price', 'id'], unique=False,
+                    postgresql_where=ACTIVE_IN_STOCK)
+    op.create_index('ix_product_category_rating', 'product', ['category_id', 'rating', 'id'], unique=False,
+                    postgresql_where=ACTIVE_IN_STOCK)
+    op.create_index('ix_product_active_price', 'product', ['price', 'id'], unique=False,
+                    postgresql_where=ACTIVE_IN_STOCK)
+    op.create_index('ix_product_active_rating', 'product', ['rating', 'id'], unique=False,
+                    postgresql_where=ACTIVE_IN_STOCK)
+    op.create_index('ix_product_category_id', 'product', ['category_id'], unique=False)
+    op.create_index('ix_product_supplier_id', 'product', ['supplier_id'], unique=False)
+    op.create_index('ix_review_product_active', 'review', ['product_id', 'id'], unique=False,
+                    postgresql_where=sa.text('is_active'))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_review_product_active', table_name='review')
+    op.drop_index('ix_product_supplier_id', table_name='product')
+    op.drop_index('ix_product_category_id', table_name='product')
+    op.drop_index('ix_product_active_rating', table_name='product')
+    op.drop_index('ix_product_active_price', table_name='product')
+    op.drop_index('ix_product_category_rating', table_name='product')
+    op.drop_index('ix_product_category_price', table_name='product')
@@ -0,0 +1,28 @@
+"""user token epoch
+
+Revision ID: f1a6b3c9d254
+Revises: c4d72e1a9f30
+Create Date: 2026-10-18 15:02:17.540921
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f1a6b3c9d254'
+down_revision: Union[str, None] = 'c4d72e1a9f30'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('user', sa.Column('token_epoch', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('user', 'token_epoch')
@@ -1,4 +1,6 @@
 from .category import Category
+from .category_rollup import CategoryRollup
 from .product import Product
+from .refresh_token import RefreshTokenRecord
 from .review import Review
-from .user import User
\ No newline at end of file
+from .user import User
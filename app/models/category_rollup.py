@@ -0,0 +1,14 @@
+from sqlalchemy import BigInteger, Column, DateTime, Float, ForeignKey, Integer
+
+from app.backend.db import Base
+
+
+class CategoryRollup(Base):
+    """ Агрегаты по категории вместе со всеми потомками, пересчитываются фоном """
+    __tablename__ = 'category_rollup'
+    category_id = Column(Integer, ForeignKey('category.id', ondelete='CASCADE'), primary_key=True)
+    product_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(BigInteger, nullable=False, default=0)
+    reviews_count = Column(Integer, nullable=False, default=0)
+    rating = Column(Float, nullable=False, default=0.0)
+    refreshed_at = Column(DateTime, nullable=False)
@@ -1,11 +1,25 @@
-from sqlalchemy import Column, Numeric, Integer, Boolean, Float, String, ForeignKey
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Computed, Index, Numeric, Integer, Boolean, Float, String, ForeignKey, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.orm import deferred, relationship
 
 from app.backend.db import Base
 
 
 class Product(Base):
     __tablename__ = "product"
+    __table_args__ = (
+        # Частичные индексы под витрину: только активные товары в наличии
+        Index('ix_product_category_price', 'category_id', 'price', 'id',
+              postgresql_where=text('is_active AND stock > 0')),
+        Index('ix_product_category_rating', 'category_id', 'rating', 'id',
+              postgresql_where=text('is_active AND stock > 0')),
+        Index('ix_product_active_price', 'price', 'id', postgresql_where=text('is_active AND stock > 0')),
+        Index('ix_product_active_rating', 'rating', 'id', postgresql_where=text('is_active AND stock > 0')),
+        Index('ix_product_category_id', 'category_id'),
+        Index('ix_product_supplier_id', 'supplier_id'),
+        Index('ix_product_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_product_name_trgm', 'name', postgresql_using='gin', postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String)
     description = Column(String)
@@ -15,9 +29,17 @@ class Product(Base):
     image_url = Column(String, nullable=True)
     stock = Column(Integer)
     rating = Column(Float)
+    rating_sum = Column(Integer, default=0, server_default='0', nullable=False)
     reviews_count = Column(Integer, default=0)
     category_id = Column(Integer, ForeignKey('category.id'))
     supplier_id = Column(Integer, ForeignKey('user.id'), nullable=True)
+    # Поисковый вектор вычисляет Postgres, из ORM он не читается без явного запроса
+    search_vector = deferred(Column(
+        TSVECTOR,
+        Computed("setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+                 "setweight(to_tsvector('simple', coalesce(description, '')), 'B')", persisted=True),
+        info={'internal': True},
+    ))
 
     category = relationship('Category', back_populates='products', uselist=False)
     reviews = relationship('Review', back_populates='product', uselist=True)
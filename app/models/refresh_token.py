@@ -0,0 +1,15 @@
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+
+from app.backend.db import Base
+
+
+class RefreshTokenRecord(Base):
+    """ Выданный refresh-токен: обмен и отзыв видны всем воркерам, а не только процессу, выдавшему токен """
+    __tablename__ = 'refresh_token'
+    jti = Column(String(32), primary_key=True)
+    # Цепочка ротации, начатая входом по паролю; при повторном обмене отзывается целиком
+    family = Column(String(32), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    used_at = Column(DateTime(timezone=True))
+    revoked_at = Column(DateTime(timezone=True))
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, ForeignKey, Boolean, DateTime, String
+from sqlalchemy import Column, Index, Integer, ForeignKey, Boolean, DateTime, String, text
 from sqlalchemy.orm import relationship
 
 from app.backend.db import Base
@@ -6,6 +6,9 @@ from app.backend.db import Base
 
 class Review(Base):
     __tablename__ = 'review'
+    __table_args__ = (
+        Index('ix_review_product_active', 'product_id', 'id', postgresql_where=text('is_active')),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey('user.id'))
     product_id = Column(Integer, ForeignKey('product.id'))
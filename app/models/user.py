@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean
+from sqlalchemy import Column, DateTime, Integer, String, Boolean
 from sqlalchemy.orm import relationship
 
 from app.backend.db import Base
@@ -16,5 +16,9 @@ class User(Base):
     is_admin = Column(Boolean, default=False)
     is_supplier = Column(Boolean, default=False)
     is_customer = Column(Boolean, default=True)
+    # Увеличивается при смене ролей и деактивации: токены с меньшей эпохой больше не принимаются
+    token_epoch = Column(Integer, default=0, server_default='0', nullable=False)
+    # Когда эпоха сдвигалась в последний раз: по этой колонке остальные воркеры узнают об отзыве токенов
+    token_epoch_changed_at = Column(DateTime(timezone=True), nullable=True, index=True)
 
     reviews = relationship('Review', back_populates='user', uselist=True)
\ No newline at end of file
@@ -1,25 +1,42 @@
+import asyncio
+import hashlib
+import math
 import os
+import uuid
 from datetime import timedelta, datetime, timezone
 from typing import Annotated
 
 import jwt
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.security import HTTPBasic, HTTPBasicCredentials, OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
-from sqlalchemy import insert, select
+from sqlalchemy import delete, func, insert, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
+from app.backend.cache import TTLCache
 from app.backend.db_depends import get_db
+from app.backend.hashing import password_hasher
+from app.backend.rate_limit import login_ip_limiter, login_username_limiter
+from app.backend.token_epochs import TokenEpochPoller, next_epoch, revoke_user, token_epochs
+from app.models.refresh_token import RefreshTokenRecord
 from app.models.user import User
-from app.schemas import CreateUser
+from app.schemas import CreateUser, CreateUsers, RefreshToken
 
 router = APIRouter(prefix='/auth', tags=['auth'])
-bcrypt_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
 
 secret_key = os.environ.get('SECRET_KEY')
 algorithm = os.environ.get('ALGORITHM')
 
+# Короткий access-токен ограничивает окно, если другой воркер не узнал о новой эпохе пользователя из опроса базы
+ACCESS_TOKEN_MINUTES = float(os.environ.get('ACCESS_TOKEN_MINUTES', 5))
+REFRESH_TOKEN_DAYS = float(os.environ.get('REFRESH_TOKEN_DAYS', 14))
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 10_000))
+USER_INSERT_BATCH = 1000
+token_cache = TTLCache(maxsize=TOKEN_CACHE_SIZE)
+# При старте воркера читаются эпохи, сдвинутые за время жизни access-токена: более старые токены уже истекли
+token_epoch_poller = TokenEpochPoller(lookback=ACCESS_TOKEN_MINUTES * 60)
+
 # ------Base auth------
 # security = HTTPBasic()
 #
@@ -36,23 +53,35 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl='auth/token')
 
 async def authenticate_user(db: Annotated[AsyncSession, Depends(get_db)], username: str, password: str):
     user = await db.scalar(select(User).where(User.username == username))
-    if not user or not bcrypt_context.verify(password, user.hashed_password):
+    verified, new_hash = False, None
+    if user:
+        verified, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    else:
+        # Неизвестный логин отвечает за то же время, что и неверный пароль, но не занимает пул хэширования
+        await asyncio.sleep(password_hasher.verify_seconds)
+    if not verified or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Invalid authentication credentials',
             headers={'WWW-Authenticate': 'Bearer'}
         )
+    # Параметры стоимости bcrypt изменились - сохраняем пересчитанный хэш
+    if new_hash:
+        await db.execute(update(User).where(User.id == user.id).values(hashed_password=new_hash))
+        await db.commit()
     return user
 
 async def create_access_token(username:str, user_id:int, is_admin: bool,
                               is_supplier: bool, is_customer: bool,
-                              expires_delta: timedelta):
+                              expires_delta: timedelta, token_epoch: int = 0):
     payload = {
         'sub': username,
         'id': user_id,
         'is_admin': is_admin,
         'is_supplier': is_supplier,
         'is_customer': is_customer,
+        'epoch': token_epoch,
+        'type': 'access',
         'exp': datetime.now(timezone.utc) + expires_delta
     }
 
@@ -60,72 +89,232 @@ async def create_access_token(username:str, user_id:int, is_admin: bool,
     payload['exp'] = int(payload['exp'].timestamp())
     return jwt.encode(payload, secret_key, algorithm=algorithm)
 
-@router.post('/token')
-async def login(db: Annotated[AsyncSession, Depends(get_db)], form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
-    user = await authenticate_user(db, form_data.username, form_data.password)
+async def create_refresh_token(username: str, user_id: int, jti: str, family: str, expires_at: datetime):
+    """ Ролей и эпохи в refresh-токене нет: при обмене они читаются из базы, так что смена ролей его не отзывает """
+    payload = {
+        'sub': username,
+        'id': user_id,
+        'type': 'refresh',
+        'jti': jti,
+        'family': family,
+        'exp': int(expires_at.timestamp()),
+    }
+    return jwt.encode(payload, secret_key, algorithm=algorithm)
 
-    token = await create_access_token(user.username, user.id, user.is_admin, user.is_supplier,
-                                      user.is_customer, expires_delta=timedelta(minutes=20))
+async def issue_tokens(db: AsyncSession, user: User, family: str | None = None) -> dict:
+    """ Пара токенов; family связывает refresh-токены одной цепочки ротации, начатой входом по паролю """
+    revoke_user(user.id, user.token_epoch)
+    access_token = await create_access_token(user.username, user.id, user.is_admin, user.is_supplier,
+                                             user.is_customer, expires_delta=timedelta(minutes=ACCESS_TOKEN_MINUTES),
+                                             token_epoch=user.token_epoch)
+    if family is None:
+        family = uuid.uuid4().hex
+        # Вход по паролю заодно убирает истекшие токены пользователя, иначе таблица только растет
+        await db.execute(delete(RefreshTokenRecord).where(RefreshTokenRecord.user_id == user.id,
+                                                          RefreshTokenRecord.expires_at < func.now()))
+    jti = uuid.uuid4().hex
+    expires_at = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_DAYS)
+    refresh_token = await create_refresh_token(user.username, user.id, jti, family, expires_at)
+    await db.execute(insert(RefreshTokenRecord).values(jti=jti, family=family, user_id=user.id,
+                                                       expires_at=expires_at))
+    await db.commit()
     return {
-        'access_token': token,
+        'access_token': access_token,
+        'refresh_token': refresh_token,
         'token_type': 'bearer',
+        'expires_in': int(ACCESS_TOKEN_MINUTES * 60),
     }
 
+def _too_many_attempts(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail='Too many login attempts, try again later',
+        headers={'Retry-After': str(math.ceil(retry_after))},
+    )
 
-async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+def _login_rate_keys(request: Request, username: str) -> tuple[str, str]:
+    # За обратным прокси адрес клиента подставляет uvicorn --proxy-headers
+    client_ip = request.client.host if request.client else 'unknown'
+    return f'ip:{client_ip}', f'user:{username.strip().lower()}'
+
+async def check_login_rate(request: Request, username: str) -> None:
+    """ Корзины токенов по IP и по логину; отказ 429 до запросов к базе и bcrypt """
+    ip_key, username_key = _login_rate_keys(request, username)
+    # Сначала проверяются обе корзины: отказ по логину не должен тратить попытку IP и наоборот
+    retry_after = max(await login_ip_limiter.check(ip_key), await login_username_limiter.check(username_key))
+    if not retry_after:
+        # Попытка с IP списывается всегда, попытка по логину - только при неверном пароле
+        retry_after = await login_ip_limiter.hit(ip_key)
+    if retry_after:
+        raise _too_many_attempts(retry_after)
+
+@router.post('/token')
+async def login(request: Request, db: Annotated[AsyncSession, Depends(get_db)],
+                form_data: Annotated[OAuth2PasswordRequestForm, Depends()]):
+    await check_login_rate(request, form_data.username)
+    try:
+        user = await authenticate_user(db, form_data.username, form_data.password)
+    except HTTPException:
+        await login_username_limiter.hit(_login_rate_keys(request, form_data.username)[1])
+        raise
+    return await issue_tokens(db, user)
+
+
+@router.post('/refresh')
+async def refresh(db: Annotated[AsyncSession, Depends(get_db)], refresh_token: RefreshToken):
+    """ Обмен refresh-токена на новую пару без проверки пароля; старый refresh-токен одноразовый """
+    claims = _decode_token(refresh_token.refresh_token, token_type='refresh')
+    if claims['jti'] is None or claims['family'] is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate user'
+        )
+    # Условный UPDATE атомарен: из одновременных обменов одного токена, в каком бы воркере они ни шли, пройдет один
+    record = (await db.execute(
+        update(RefreshTokenRecord)
+        .where(RefreshTokenRecord.jti == claims['jti'], RefreshTokenRecord.used_at.is_(None),
+               RefreshTokenRecord.revoked_at.is_(None))
+        .values(used_at=func.now())
+        .returning(RefreshTokenRecord.user_id, RefreshTokenRecord.family)
+    )).one_or_none()
+    if record is None:
+        raise await _refresh_denied(db, claims['jti'])
+
+    # Актуальные роли, эпоха и признак активности; удаленный пользователь обменять токен не может
+    user = await db.scalar(select(User).where(User.id == record.user_id))
+    if not user or not user.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate user'
+        )
+    return await issue_tokens(db, user, family=record.family)
+
+
+async def _refresh_denied(db: AsyncSession, jti: str) -> HTTPException:
+    """ Причина, по которой токен не обменян: неизвестен, отозван или уже использован """
+    record = await db.scalar(select(RefreshTokenRecord).where(RefreshTokenRecord.jti == jti))
+    if record is None or record.revoked_at is not None:
+        return HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate user'
+        )
+    # Повторный обмен значит, что токен утек: закрываем всю цепочку и выданные access-токены пользователя.
+    # Повторы того же токена дальше отсекаются как отозванные и эпоху больше не сдвигают
+    await db.execute(update(RefreshTokenRecord)
+                     .where(RefreshTokenRecord.family == record.family, RefreshTokenRecord.revoked_at.is_(None))
+                     .values(revoked_at=func.now()))
+    token_epoch = await db.scalar(update(User).where(User.id == record.user_id)
+                                  .values(**next_epoch()).returning(User.token_epoch))
+    await db.commit()
+    if token_epoch is not None:
+        revoke_user(record.user_id, token_epoch)
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail='Refresh token has already been used'
+    )
+
+
+async def revoke_refresh_tokens(db: AsyncSession, user_ids: list[int]) -> None:
+    """ Отзыв всех refresh-токенов пользователей в текущей транзакции, например при деактивации """
+    await db.execute(update(RefreshTokenRecord)
+                     .where(RefreshTokenRecord.user_id.in_(user_ids), RefreshTokenRecord.revoked_at.is_(None))
+                     .values(revoked_at=func.now()))
+
+
+def _decode_token(token: str, token_type: str = 'access') -> dict:
     try:
         payload = jwt.decode(token, secret_key, algorithms=[algorithm])
-        username: str | None = payload.get('sub')
-        user_id: int | None = payload.get('id')
-        is_admin: bool | None = payload.get('is_admin')
-        is_supplier: bool | None = payload.get('is_supplier')
-        is_customer: bool | None = payload.get('is_customer')
-        expire: int | None = payload.get('exp')
-
-        if username is None or user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail='Could not validate user'
-            )
-        if expire is None:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No access token supplied"
-            )
-
-        if not isinstance(expire, int):
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Invalid token format"
-            )
-
-        # Проверка срока действия токена
-        current_time = datetime.now(timezone.utc).timestamp()
-
-        if expire < current_time:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token expired!"
-            )
-
-        return {
-            'username': username,
-            'id': user_id,
-            'is_admin': is_admin,
-            'is_supplier': is_supplier,
-            'is_customer': is_customer,
-        }
     except jwt.ExpiredSignatureError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token expired!"
         )
-    except jwt.exceptions:
+    except jwt.InvalidTokenError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate user'
+        )
+    username: str | None = payload.get('sub')
+    user_id: int | None = payload.get('id')
+    is_admin: bool | None = payload.get('is_admin')
+    is_supplier: bool | None = payload.get('is_supplier')
+    is_customer: bool | None = payload.get('is_customer')
+    expire: int | None = payload.get('exp')
+    epoch: int = payload.get('epoch', 0)
+
+    # Токены, выданные до появления refresh-токенов, типа не содержат и считаются access
+    if payload.get('type', 'access') != token_type:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail='Could not validate user'
         )
 
+    if username is None or user_id is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate user'
+        )
+    if expire is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No access token supplied"
+        )
+
+    if not isinstance(expire, int):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid token format"
+        )
+
+    principal = {
+        'username': username,
+        'id': user_id,
+        'is_admin': is_admin,
+        'is_supplier': is_supplier,
+        'is_customer': is_customer,
+        'epoch': epoch,
+        'exp': expire,
+    }
+    if token_type == 'refresh':
+        principal['jti'] = payload.get('jti')
+        principal['family'] = payload.get('family')
+    return principal
+
+
+def _cached_principal(token: str) -> dict:
+    # Подпись проверяется один раз на токен, дальше principal берется из кэша до истечения exp
+    digest = hashlib.sha256(token.encode()).digest()
+    principal = token_cache.get(digest)
+    if principal is None:
+        principal = _decode_token(token)
+        token_cache.set(digest, principal, expires_at=principal['exp'])
+    return principal
+
+
+def token_user_id(token: str) -> int | None:
+    """ id пользователя из действительного access-токена без проверки отзыва; None для любого другого токена """
+    try:
+        return _cached_principal(token)['id']
+    except HTTPException:
+        return None
+
+
+async def get_current_user(token: Annotated[str, Depends(oauth2_scheme)]):
+    principal = _cached_principal(token)
+
+    # Срок действия проверяет jwt.decode, а запись кэша живет ровно до exp
+    known_epoch = token_epochs.get(principal['id'], 0)
+    if principal['epoch'] < known_epoch:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail='Could not validate user'
+        )
+    # Подписанная эпоха не может опережать базу: новый токен сообщает воркеру о смене ролей,
+    # выполненной в другом процессе, и старые токены того же пользователя здесь тоже перестают работать
+    if principal['epoch'] > known_epoch:
+        token_epochs[principal['id']] = principal['epoch']
+    return principal
+
 @router.get('/read_current_user')
 async def read_current_user(user: str = Depends(get_current_user)):
     return user
@@ -137,10 +326,86 @@ async def create_user(db: Annotated[AsyncSession, Depends(get_db)], create_user:
         last_name=create_user.last_name,
         username=create_user.username,
         email=create_user.email,
-        hashed_password=bcrypt_context.encrypt(create_user.password),
+        hashed_password=await password_hasher.hash(create_user.password),
     ))
     await db.commit()
     return {
         'status_code': status.HTTP_201_CREATED,
         'transaction': 'success',
-    }
\ No newline at end of file
+    }
+
+
+async def _taken(db: AsyncSession, usernames: set[str], emails: set[str]) -> tuple[set[str], set[str]]:
+    """ Уже занятые логины и email из переданных """
+    taken = (await db.execute(select(User.username, User.email).where(
+        or_(User.username.in_(usernames), User.email.in_(emails))))).all()
+    return {row.username for row in taken} & usernames, {row.email for row in taken} & emails
+
+@router.post('/bulk', status_code=status.HTTP_201_CREATED)
+async def create_users(db: Annotated[AsyncSession, Depends(get_db)],
+                       get_user: Annotated[dict, Depends(get_current_user)], create_users: CreateUsers):
+    """ Пакетное создание пользователей; строки с занятым логином или email пропускаются и попадают в conflicts """
+    if not get_user.get('is_admin'):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have admin permission"
+        )
+
+    conflicts = []
+    candidates = []
+    usernames, emails = set(), set()
+    for index, user in enumerate(create_users.users):
+        field = 'username' if user.username in usernames else 'email' if user.email in emails else None
+        if field:
+            conflicts.append({'index': index, 'username': user.username, 'field': field,
+                              'detail': 'Duplicate in request'})
+            continue
+        usernames.add(user.username)
+        emails.add(user.email)
+        candidates.append((index, user))
+
+    # Занятые логины и email отсеиваются одним запросом до bcrypt - хэширование здесь самая дорогая часть
+    taken_usernames, taken_emails = await _taken(db, usernames, emails)
+    # Транзакция закрывается до хэширования: соединение не простаивает в пуле на время bcrypt
+    await db.commit()
+    rows = []
+    for index, user in candidates:
+        field = 'username' if user.username in taken_usernames else 'email' if user.email in taken_emails else None
+        if field:
+            conflicts.append({'index': index, 'username': user.username, 'field': field, 'detail': 'Already exists'})
+        else:
+            rows.append((index, user))
+
+    hashed_passwords = await password_hasher.hash_many([user.password for _, user in rows])
+    created = []
+    skipped = []
+    for start in range(0, len(rows), USER_INSERT_BATCH):
+        batch = rows[start:start + USER_INSERT_BATCH]
+        # ON CONFLICT DO NOTHING ловит логины и email, занятые параллельным запросом после проверки выше
+        result = await db.execute(pg_insert(User).on_conflict_do_nothing().returning(User.id, User.username), [
+            {'first_name': user.first_name, 'last_name': user.last_name, 'username': user.username,
+             'email': user.email, 'hashed_password': hashed_password, 'is_active': True, 'is_admin': False,
+             'is_supplier': create_users.is_supplier, 'is_customer': not create_users.is_supplier}
+            for (_, user), hashed_password in zip(batch, hashed_passwords[start:start + USER_INSERT_BATCH])
+        ])
+        inserted = {row.username: row.id for row in result}
+        for index, user in batch:
+            if user.username in inserted:
+                created.append({'index': index, 'id': inserted[user.username], 'username': user.username})
+            else:
+                skipped.append((index, user))
+    if skipped:
+        # Строки, занятые параллельным запросом после первой проверки: повторный запрос называет поле конфликта
+        taken_usernames, taken_emails = await _taken(db, {user.username for _, user in skipped},
+                                                     {user.email for _, user in skipped})
+        for index, user in skipped:
+            field = 'username' if user.username in taken_usernames else 'email' if user.email in taken_emails else None
+            conflicts.append({'index': index, 'username': user.username, 'field': field, 'detail': 'Already exists'})
+    await db.commit()
+    conflicts.sort(key=lambda conflict: conflict['index'])
+    return {
+        'status_code': status.HTTP_201_CREATED,
+        'transaction': 'success',
+        'created': created,
+        'conflicts': conflicts,
+    }
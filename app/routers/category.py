@@ -1,32 +1,73 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, status, HTTPException
+from fastapi import APIRouter, Depends, Request, status, HTTPException
 from slugify import slugify
-from sqlalchemy import insert, select, update
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.backend.db_depends import get_db
-from app.models import Category
+from app.backend.category_rollup import rollup_refresher
+from app.backend.category_tree import category_tree
+from app.backend.db_depends import get_db, get_read_db
+from app.backend.response_cache import response_cache
+from app.backend.serialization import SchemaEncoder
+from app.backend.singleflight import category_flight
+from app.models import Category, CategoryRollup
 from app.routers.auth import get_current_user
+from app.routers.pagination import PageParams, paginate
 from app.routers.services import check_user_permissions
-from app.schemas import CreateCategory
+from app.schemas import CategoryOut, CreateCategory, Page
 
 router = APIRouter(dependencies=[] , prefix="/categories", tags=["category"])
 
-@router.get('/')
-async def get_all_categories(db: Annotated[AsyncSession, Depends(get_db)],
-                             get_user: Annotated[dict, Depends(get_current_user)]):
-    categories = await db.scalars(select(Category).where(Category.is_active == True))
-    return categories.all()
+encode_categories = SchemaEncoder(Page[CategoryOut])
+
+@router.get('/', response_model=Page[CategoryOut])
+async def get_all_categories(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)],
+                             get_user: Annotated[dict, Depends(get_current_user)],
+                             page: Annotated[PageParams, Depends()]):
+    return await response_cache.respond(request, ('category',), lambda: paginate(
+        db, Category, Category.is_active == True, page=page), encode_categories)
+
+@router.get('/tree')
+async def get_category_tree(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)],
+                            get_user: Annotated[dict, Depends(get_current_user)]):
+    """ Дерево активных категорий с числом товаров и рейтингом по всему поддереву одним запросом """
+    async def load():
+        rows = await db.execute(
+            select(Category.id, Category.name, Category.slug, Category.parent_id,
+                   func.coalesce(CategoryRollup.product_count, 0).label('product_count'),
+                   func.coalesce(CategoryRollup.reviews_count, 0).label('reviews_count'),
+                   func.coalesce(CategoryRollup.rating, 0.0).label('rating'))
+            .outerjoin(CategoryRollup, CategoryRollup.category_id == Category.id)
+            .where(Category.is_active == True)
+            .order_by(Category.id)
+        )
+        nodes, parents = {}, {}
+        for row in rows:
+            nodes[row.id] = {'id': row.id, 'name': row.name, 'slug': row.slug, 'product_count': row.product_count,
+                             'reviews_count': row.reviews_count, 'rating': row.rating, 'children': []}
+            parents[row.id] = row.parent_id
+        roots = []
+        for category_id, node in nodes.items():
+            # Потомки неактивной категории поднимаются в корень
+            parent = nodes.get(parents[category_id])
+            (parent['children'] if parent is not None else roots).append(node)
+        return roots
+
+    return await response_cache.respond(request, ('category', 'category_rollup'), load)
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
 async def create_category(db:Annotated[AsyncSession, Depends(get_db)],
                           get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))],
                           create_cat: CreateCategory):
-    await db.execute(insert(Category).values(name=create_cat.name,
-                                       parent_id=create_cat.parent_id,
-                                       slug=slugify(create_cat.name)))
+    category_id = await db.scalar(insert(Category).values(name=create_cat.name,
+                                                          parent_id=create_cat.parent_id,
+                                                          slug=slugify(create_cat.name)).returning(Category.id))
     await db.commit()
+    category_tree.add(category_id, create_cat.parent_id)
+    category_flight.clear()
+    await response_cache.bump('category')
+    rollup_refresher.mark_dirty()
     return {
         'status_code': status.HTTP_201_CREATED,
         'transaction': 'success',
@@ -42,11 +83,20 @@ async def update_category(db: Annotated[AsyncSession, Depends(get_db)],
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Category {category_slug} not found",
         )
+    if update_cat.parent_id == category.id or category_tree.would_cycle(category.id, update_cat.parent_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Category can't be moved into its own subtree",
+        )
     category.name = update_cat.name
     # category.description = update_cat.description
     category.slug = slugify(update_cat.name)
     category.parent_id = update_cat.parent_id
     await db.commit()
+    category_tree.move(category.id, update_cat.parent_id)
+    category_flight.clear()
+    await response_cache.bump('category')
+    rollup_refresher.mark_dirty()
     return {
         'status_code': status.HTTP_200_OK,
         'transaction': 'success',
@@ -64,6 +114,9 @@ async def delete_category(db: Annotated[AsyncSession, Depends(get_db)],
             detail=f"Category with slug {category_slug} not found")
     category.is_active = False
     await db.commit()
+    category_flight.clear()
+    await response_cache.bump('category')
+    rollup_refresher.mark_dirty()
     return {
         'status_code': status.HTTP_200_OK,
         'transaction': 'success',
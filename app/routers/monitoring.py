@@ -0,0 +1,83 @@
+from typing import Annotated
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import PlainTextResponse
+
+from app.backend.db import engine, pool_stats, read_engine
+from app.backend.hashing import password_hasher
+from app.backend.metrics import CallbackGauge, registry
+from app.backend.rate_limit import login_ip_limiter, login_username_limiter
+from app.backend.response_cache import response_cache
+from app.backend.singleflight import category_flight, product_flight, review_flight
+from app.routers.auth import token_cache, token_epoch_poller
+from app.routers.review import review_queue
+from app.routers.services import check_user_permissions
+
+router = APIRouter(prefix='/monitoring', tags=['monitoring'])
+# /metrics отдается без префикса и без авторизации - его опрашивает Prometheus
+metrics_router = APIRouter(tags=['monitoring'])
+
+
+def _engines() -> dict:
+    engines = {'writer': engine}
+    if read_engine is not engine:
+        engines['reader'] = read_engine
+    return engines
+
+
+def _pool_gauge(key: str):
+    return lambda: {(name,): pool_stats(item)[key] for name, item in _engines().items()}
+
+
+for _key in ('checked_out', 'overflow', 'checkouts', 'wait_count', 'wait_seconds_total'):
+    registry.register(CallbackGauge(f'db_pool_{_key}', f'Connection pool {_key.replace("_", " ")}',
+                                    ('engine',), _pool_gauge(_key)))
+
+
+@router.get('/hashing')
+async def get_hashing_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return password_hasher.stats()
+
+
+@router.get('/db_pool')
+async def get_db_pool_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return {name: pool_stats(item) for name, item in _engines().items()}
+
+
+@router.get('/token_cache')
+async def get_token_cache_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return token_cache.stats()
+
+
+@router.get('/token_epochs')
+async def get_token_epoch_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return token_epoch_poller.stats()
+
+
+@router.get('/response_cache')
+async def get_response_cache_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return response_cache.stats()
+
+
+@router.get('/review_queue')
+async def get_review_queue_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return review_queue.stats() if review_queue is not None else {'running': False}
+
+
+@router.get('/singleflight')
+async def get_singleflight_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return {
+        'product': product_flight.stats(),
+        'category': category_flight.stats(),
+        'reviews': review_flight.stats(),
+    }
+
+
+@router.get('/rate_limit')
+async def get_rate_limit_stats(get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    return {'login_ip': login_ip_limiter.stats(), 'login_username': login_username_limiter.stats()}
+
+
+@metrics_router.get('/metrics', response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4')
@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+from decimal import Decimal
+from typing import Annotated, Any, Mapping, Sequence
+
+from fastapi import HTTPException, Query
+from sqlalchemy import ColumnElement, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette import status
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class PageParams:
+    """ Параметры страницы: курсор, размер и проекция полей """
+    def __init__(self,
+                 cursor: Annotated[str | None, Query(description='Opaque cursor from next_cursor')] = None,
+                 limit: Annotated[int, Query(ge=1, le=MAX_PAGE_SIZE)] = DEFAULT_PAGE_SIZE,
+                 fields: Annotated[str | None, Query(description='Comma separated list of columns')] = None):
+        self.cursor = cursor
+        self.limit = limit
+        self.fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+
+
+def _bad_request(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def encode_cursor(sort: str, value: Any, last_id: int) -> str:
+    if isinstance(value, Decimal):
+        value = str(value)
+    raw = json.dumps([sort, value, last_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str, sort: str, column) -> tuple[Any, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, value, last_id = json.loads(raw)
+    except (binascii.Error, ValueError, TypeError):
+        raise _bad_request('Invalid cursor')
+    if cursor_sort != sort or not isinstance(last_id, int):
+        raise _bad_request('Cursor does not match sort order')
+    # Приводим значение к типу колонки, иначе asyncpg откажется сравнивать numeric со строкой
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = None
+    if value is not None and python_type is not None:
+        try:
+            value = python_type(value)
+        except (ValueError, TypeError, ArithmeticError):
+            raise _bad_request('Invalid cursor')
+    return value, last_id
+
+
+def resolve_columns(model, fields: list[str] | None, exclude: Sequence[str] = ()) -> list[str]:
+    """ Проверка запрошенных полей по колонкам модели; служебные колонки (info['internal']) не отдаются """
+    available = [column.key for column in model.__table__.columns
+                 if column.key not in exclude and not column.info.get('internal')]
+    if not fields:
+        return available
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise _bad_request(f'Unknown fields: {", ".join(unknown)}')
+    return list(dict.fromkeys(fields))
+
+
+async def paginate(db: AsyncSession, model, *where, page: PageParams,
+                   sort: str = 'id', sortable: Sequence[str] = ('id',),
+                   exclude: Sequence[str] = (), expressions: Mapping[str, ColumnElement] | None = None) -> dict:
+    """ Keyset-пагинация по (sort, id) с проекцией колонок; expressions - вычисляемые ключи сортировки """
+    descending = sort.startswith('-')
+    key = sort.lstrip('-')
+    if key not in sortable:
+        raise _bad_request(f'Unsupported sort: {sort}')
+
+    names = resolve_columns(model, page.fields, exclude)
+    expressions = expressions or {}
+    # id и ключ сортировки нужны для курсора, даже если их не запросили
+    if key in expressions:
+        sort_column = expressions[key]
+        selected = [getattr(model, name) for name in dict.fromkeys([*names, 'id'])] + [sort_column.label(key)]
+        names = [*names, key]
+    else:
+        sort_column = getattr(model, key)
+        selected = [getattr(model, name) for name in dict.fromkeys([*names, 'id', key])]
+
+    def after_id(last_id):
+        return model.id < last_id if descending else model.id > last_id
+
+    def after(value, last_id):
+        if key == 'id':
+            return after_id(last_id)
+        return (tuple_(sort_column, model.id) < tuple_(value, last_id) if descending
+                else tuple_(sort_column, model.id) > tuple_(value, last_id))
+
+    order = [sort_column] if key == 'id' else [sort_column, model.id]
+    # Сравнение кортежей с NULL дает NULL, поэтому строки с пустым ключом выбираются отдельной частью:
+    # после остальных при возрастании и перед ними при убывании, как их упорядочивает Postgres и индексы
+    table_column = model.__table__.columns.get(key)
+    nullable = (key not in expressions and table_column is not None
+                and table_column.nullable and not table_column.primary_key)
+    values_part = [[sort_column.is_not(None)] if nullable else [], order]
+    nulls_part = [[sort_column.is_(None)], [model.id]]
+    parts = ([nulls_part, values_part] if descending else [values_part, nulls_part]) if nullable else [values_part]
+    if page.cursor is not None:
+        value, last_id = decode_cursor(page.cursor, sort, sort_column)
+        # Части до той, где остановился курсор, уже выданы целиком
+        current = nulls_part if nullable and value is None else values_part
+        current[0] = [*current[0], after_id(last_id) if current is nulls_part else after(value, last_id)]
+        parts = parts[next(index for index, part in enumerate(parts) if part is current):]
+
+    rows = []
+    for conditions, part_order in parts:
+        stmt = (select(*selected).where(*where, *conditions)
+                .order_by(*(column.desc() for column in part_order) if descending else part_order))
+        rows.extend((await db.execute(stmt.limit(page.limit + 1 - len(rows)))).mappings().all())
+        if len(rows) > page.limit:
+            break
+
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, last[key], last['id'])
+
+    return {
+        'items': [{name: row[name] for name in names} for row in rows],
+        'next_cursor': next_cursor,
+    }
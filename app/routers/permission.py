@@ -6,8 +6,10 @@ from sqlalchemy import select, update
 from starlette import status
 
 from app.backend.db_depends import get_db
+from app.backend.token_epochs import next_epoch, revoke_user
 from app.models.user import User
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user, revoke_refresh_tokens
+from app.schemas import BulkPermission, BulkUsers
 
 router = APIRouter(prefix="/permission", tags=["permission"])
 
@@ -23,15 +25,20 @@ async def patch_permission(db: Annotated[AsyncSession, Depends(get_db)],
                 detail='User not found'
             )
         if user.is_supplier:
-            await db.execute(update(User).where(User.id == user_id).values(is_supplier=False, is_customer=True))
+            token_epoch = await db.scalar(update(User).where(User.id == user_id).values(
+                is_supplier=False, is_customer=True, **next_epoch()).returning(User.token_epoch))
             await db.commit()
+            # Токены со старыми ролями отклоняются сразу, клиент получает новые через /auth/refresh
+            revoke_user(user_id, token_epoch)
             return {
                 'status_code': status.HTTP_200_OK,
                 'detail': 'User is no longer supplier'
             }
         else:
-            await db.execute(update(User).where(User.id == user_id).values(is_supplier=True, is_customer=False))
+            token_epoch = await db.scalar(update(User).where(User.id == user_id).values(
+                is_supplier=True, is_customer=False, **next_epoch()).returning(User.token_epoch))
             await db.commit()
+            revoke_user(user_id, token_epoch)
             return {
                 'status_code': status.HTTP_200_OK,
                 'detail': 'User is now supplier'
@@ -62,8 +69,11 @@ async def delete_user(db: Annotated[AsyncSession, Depends(get_db)],
             )
 
         if user.is_active:
-            await db.execute(update(User).where(User.id == user_id).values(is_active=False))
+            token_epoch = await db.scalar(update(User).where(User.id == user_id).values(
+                is_active=False, **next_epoch()).returning(User.token_epoch))
+            await revoke_refresh_tokens(db, [user_id])
             await db.commit()
+            revoke_user(user_id, token_epoch)
             return {
                 'status_code': status.HTTP_200_OK,
                 'detail': 'User is deleted'
@@ -77,4 +87,62 @@ async def delete_user(db: Annotated[AsyncSession, Depends(get_db)],
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="You don't have admin permission"
-        )
\ No newline at end of file
+        )
+
+
+@router.patch('/bulk')
+async def patch_permissions(db: Annotated[AsyncSession, Depends(get_db)],
+                            get_user: Annotated[dict, Depends(get_current_user)], bulk: BulkPermission):
+    """ Назначение роли списку пользователей одним UPDATE; skipped - не найдены, удалены или роль уже такая """
+    if get_user.get('is_admin'):
+        result = await db.execute(
+            update(User)
+            .where(User.id.in_(bulk.user_ids), User.is_active == True, User.is_supplier != bulk.is_supplier)
+            .values(is_supplier=bulk.is_supplier, is_customer=not bulk.is_supplier, **next_epoch())
+            .returning(User.id, User.token_epoch)
+        )
+        updated = result.all()
+        await db.commit()
+        for user_id, token_epoch in updated:
+            revoke_user(user_id, token_epoch)
+        updated_ids = {user_id for user_id, _ in updated}
+        return {
+            'status_code': status.HTTP_200_OK,
+            'updated': sorted(updated_ids),
+            'skipped': sorted(set(bulk.user_ids) - updated_ids),
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have admin permission"
+        )
+
+
+@router.post('/bulk_delete')
+async def delete_users(db: Annotated[AsyncSession, Depends(get_db)],
+                       get_user: Annotated[dict, Depends(get_current_user)], bulk: BulkUsers):
+    """ Деактивация списка пользователей одним UPDATE; администраторы и уже удаленные попадают в skipped """
+    if get_user.get('is_admin'):
+        result = await db.execute(
+            update(User)
+            .where(User.id.in_(bulk.user_ids), User.is_active == True, User.is_admin == False)
+            .values(is_active=False, **next_epoch())
+            .returning(User.id, User.token_epoch)
+        )
+        deleted = result.all()
+        if deleted:
+            await revoke_refresh_tokens(db, [user_id for user_id, _ in deleted])
+        await db.commit()
+        for user_id, token_epoch in deleted:
+            revoke_user(user_id, token_epoch)
+        deleted_ids = {user_id for user_id, _ in deleted}
+        return {
+            'status_code': status.HTTP_200_OK,
+            'deleted': sorted(deleted_ids),
+            'skipped': sorted(set(bulk.user_ids) - deleted_ids),
+        }
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have admin permission"
+        )
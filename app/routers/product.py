@@ -1,121 +1,494 @@
-from typing import Annotated
+import os
+from decimal import Decimal
+from typing import Annotated, AsyncIterator, Literal
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from fastapi.params import Depends
+from pydantic import ValidationError
 from slugify import slugify
-from sqlalchemy import insert, select, update
+from sqlalchemy import Float, Select, case, func, insert, or_, select, true, tuple_, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from starlette import status
 
-from app.backend.db_depends import get_db
+from app.backend.category_tree import category_tree, fetch_subtree
+from app.backend.db import async_read_session_marker
+from app.backend.db_depends import get_db, get_read_db
+from app.backend.response_cache import response_cache
+from app.backend.serialization import SchemaEncoder
+from app.backend.singleflight import category_flight, detached_session, invalidate_products, product_flight
+from app.backend.streaming import encode_stream, iter_records
 from app.models import Product, Category
 from app.routers.auth import get_current_user
-from app.routers.services import check_user_permissions
-from app.schemas import CreateProduct
+from app.routers.pagination import PageParams, paginate, resolve_columns
+from app.routers.services import (FOREIGN_KEY_VIOLATION, UNIQUE_VIOLATION, allocate_slugs, check_user_permissions,
+                                  integrity_error_code)
+from app.schemas import CreateProduct, Page, ProductOut, ProductSearchOut, ReserveStock
 
 router = APIRouter(prefix='/products', tags=['product'])
 
-@router.get('/')
-async def get_all_products(db: Annotated[AsyncSession, Depends(get_db)],
-                           get_user: Annotated[dict, Depends(get_current_user)]):
-    products = await db.scalars(select(Product).where(Product.is_active==True, Product.stock > 0))
-    return products.all()
+PRODUCT_SORT_KEYS = ('id', 'price', 'rating')
+# newest - по убыванию id: id монотонно растет, отдельной даты создания у товара нет
+PRODUCT_SORT_ALIASES = {'newest': '-id'}
+PRICE_BUCKETS = tuple(float(bound) for bound in os.environ.get('PRICE_BUCKETS', '0,10,50,100,500,1000').split(','))
+BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 1000))
+BULK_MAX_ERRORS = int(os.environ.get('BULK_MAX_ERRORS', 1000))
+EXPORT_CHUNK_SIZE = int(os.environ.get('EXPORT_CHUNK_SIZE', 1000))
+
+encode_products = SchemaEncoder(Page[ProductOut])
+encode_search_results = SchemaEncoder(Page[ProductSearchOut])
+encode_product = SchemaEncoder(ProductOut)
+
+def _integrity_http_error(exc: IntegrityError) -> Exception:
+    if integrity_error_code(exc) == FOREIGN_KEY_VIOLATION:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail='There is no category found'
+        )
+    if integrity_error_code(exc) == UNIQUE_VIOLATION:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail='Product with this name already exists'
+        )
+    return exc
+
+
+async def _write_denied(db: AsyncSession, product_slug: str) -> HTTPException:
+    """ Причина, по которой UPDATE не затронул строк: товара нет или он чужой """
+    if await db.scalar(select(Product.id).where(Product.slug == product_slug)) is None:
+        return HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f'Product {product_slug} not found'
+        )
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail='Permission denied'
+    )
+
+
+def _owned_by(get_user: dict):
+    if get_user.get('is_admin'):
+        return true()
+    return Product.supplier_id == get_user.get('id')
+
+
+class ProductFilters:
+    """ Фильтры витрины: диапазон цены, минимальный рейтинг, поставщик """
+    # Цена сравнивается как Decimal: параметр типа float привязывается как FLOAT, колонка NUMERIC приводится
+    # к нему, и частичные индексы по цене перестают ограничивать диапазон
+    def __init__(self,
+                 min_price: Annotated[Decimal | None, Query(ge=0)] = None,
+                 max_price: Annotated[Decimal | None, Query(ge=0)] = None,
+                 min_rating: Annotated[float | None, Query(ge=0, le=5)] = None,
+                 supplier_id: int | None = None):
+        self.min_price = min_price
+        self.max_price = max_price
+        self.min_rating = min_rating
+        self.supplier_id = supplier_id
+
+    def clauses(self) -> list:
+        clauses = []
+        if self.min_price is not None:
+            clauses.append(Product.price >= self.min_price)
+        if self.max_price is not None:
+            clauses.append(Product.price <= self.max_price)
+        if self.min_rating is not None:
+            clauses.append(Product.rating >= self.min_rating)
+        if self.supplier_id is not None:
+            clauses.append(Product.supplier_id == self.supplier_id)
+        return clauses
+
+
+async def _category_id(db: AsyncSession, category_slug: str) -> int | None:
+    async def load():
+        async with detached_session(db) as session:
+            return await session.scalar(select(Category.id).where(Category.slug == category_slug))
+
+    return await category_flight.do((db.bind, category_slug), load)
+
+
+async def _category_subtree(db: AsyncSession, category_slug: str):
+    category_id = await _category_id(db, category_slug)
+    if category_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
+    subtree = category_tree.subtree(category_id)
+    if subtree is None:
+        subtree = await fetch_subtree(db, category_id)
+        category_tree.schedule_refresh()
+    return subtree
+
+
+@router.get('/', response_model=Page[ProductOut])
+async def get_all_products(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)],
+                           get_user: Annotated[dict, Depends(get_current_user)],
+                           page: Annotated[PageParams, Depends()],
+                           filters: Annotated[ProductFilters, Depends()], sort: str = 'id'):
+    return await response_cache.respond(request, ('product',), lambda: paginate(
+        db, Product, Product.is_active==True, Product.stock > 0, *filters.clauses(),
+        page=page, sort=PRODUCT_SORT_ALIASES.get(sort, sort), sortable=PRODUCT_SORT_KEYS),
+        encode_products)
 
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
 async def create_product(db: Annotated[AsyncSession, Depends(get_db)],
                           get_user: Annotated[dict, Depends(check_user_permissions(['is_admin', 'is_supplier']))],
                           create_prod: CreateProduct):
-    category = await db.scalar(select(Category).where(Category.id == create_prod.category_id))
-    if category is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='There is no category found'
+    # Существование категории проверяет внешний ключ, отдельный SELECT не нужен
+    try:
+        await db.execute(insert(Product).values(
+            name=create_prod.name,
+            slug=slugify(create_prod.name),
+            price=create_prod.price,
+            description=create_prod.description,
+            is_active=True,
+            rating=0.0,
+            image_url=create_prod.image_url,
+            stock=create_prod.stock,
+            category_id=create_prod.category_id,
+            supplier_id=get_user.get('id'),
+        ))
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        raise _integrity_http_error(exc)
+    await invalidate_products()
+    return {
+        'status_code': status.HTTP_201_CREATED,
+        'transaction': 'success',
+    }
+
+def _product_row(product: CreateProduct, slug: str, supplier_id: int) -> dict:
+    return {
+        'name': product.name,
+        'slug': slug,
+        'price': product.price,
+        'description': product.description,
+        'is_active': True,
+        'rating': 0.0,
+        'image_url': product.image_url,
+        'stock': product.stock,
+        'category_id': product.category_id,
+        'supplier_id': supplier_id,
+    }
+
+
+def _integrity_detail(exc: IntegrityError) -> str:
+    if integrity_error_code(exc) == FOREIGN_KEY_VIOLATION:
+        return 'There is no category found'
+    if integrity_error_code(exc) == UNIQUE_VIOLATION:
+        return 'Product with this slug already exists'
+    return f'Rejected by database: {exc.orig}'
+
+
+async def _insert_batch(db: AsyncSession, batch: list[tuple[int, CreateProduct]],
+                        supplier_id: int, taken: set[str]) -> list[tuple[int, str]]:
+    """ Вставка пачки одним запросом; возвращает отклоненные строки: (номер строки, причина) """
+    slugs = await allocate_slugs(db, [product.name for _, product in batch], taken)
+    rows = [_product_row(product, slug, supplier_id) for (_, product), slug in zip(batch, slugs)]
+    # Слаг, занятый параллельным импортом после allocate_slugs, отсекает ON CONFLICT, а не ошибка всей пачки
+    stmt = pg_insert(Product).on_conflict_do_nothing(index_elements=[Product.slug]).returning(Product.slug)
+    try:
+        inserted = set(await db.scalars(stmt, rows))
+        await db.commit()
+    except IntegrityError:
+        # Остальные нарушения (например, категорию удалили во время импорта) ищем построчно в точках сохранения
+        await db.rollback()
+        return await _insert_rows(db, batch, rows, stmt)
+    return [(line, 'Product with this slug already exists')
+            for (line, _), row in zip(batch, rows) if row['slug'] not in inserted]
+
+
+async def _insert_rows(db: AsyncSession, batch: list[tuple[int, CreateProduct]], rows: list[dict],
+                       stmt) -> list[tuple[int, str]]:
+    rejected = []
+    for (line, _), row in zip(batch, rows):
+        try:
+            async with db.begin_nested():
+                slug = await db.scalar(stmt.values(row))
+        except IntegrityError as exc:
+            rejected.append((line, _integrity_detail(exc)))
+            continue
+        if slug is None:
+            rejected.append((line, 'Product with this slug already exists'))
+    await db.commit()
+    return rejected
+
+
+@router.post('/bulk')
+async def bulk_create_products(request: Request, db: Annotated[AsyncSession, Depends(get_db)],
+                               get_user: Annotated[dict, Depends(check_user_permissions(['is_admin', 'is_supplier']))]):
+    """ Потоковый импорт CSV (text/csv) или NDJSON: пачки по BULK_BATCH_SIZE строк, коммит на пачку """
+    if not category_tree.is_warm:
+        await category_tree.load(db)
+    category_ids = set(category_tree.ids())
+    missing_ids: set[int] = set()
+
+    taken: set[str] = set()
+    batch: list[tuple[int, CreateProduct]] = []
+    errors: list[dict] = []
+    total = created = failed = 0
+
+    def reject(line: int, detail: str) -> None:
+        nonlocal failed
+        failed += 1
+        if len(errors) < BULK_MAX_ERRORS:
+            errors.append({'row': line, 'detail': detail})
+
+    async def flush() -> None:
+        nonlocal created
+        unknown = {product.category_id for _, product in batch} - category_ids - missing_ids
+        if unknown:
+            # Дерево в памяти воркера может отставать от категорий, созданных в другом процессе:
+            # неизвестные id проверяются одним запросом, а не отклоняются по снимку
+            found = set(await db.scalars(select(Category.id).where(Category.id.in_(unknown))))
+            category_ids.update(found)
+            missing_ids.update(unknown - found)
+            if found:
+                category_tree.schedule_refresh()
+        accepted = []
+        for line, product in batch:
+            if product.category_id in missing_ids:
+                reject(line, 'There is no category found')
+            else:
+                accepted.append((line, product))
+        batch.clear()
+        if not accepted:
+            return
+        rejected = await _insert_batch(db, accepted, get_user.get('id'), taken)
+        created += len(accepted) - len(rejected)
+        for line, detail in rejected:
+            reject(line, detail)
+
+    async for line, record, error in iter_records(request):
+        total += 1
+        if error is not None:
+            reject(line, error)
+            continue
+        try:
+            product = CreateProduct.model_validate(record)
+        except ValidationError as exc:
+            reject(line, '; '.join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in exc.errors()))
+            continue
+        batch.append((line, product))
+        if len(batch) >= BULK_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+
+    if created:
+        await invalidate_products()
+    return {
+        'status_code': status.HTTP_200_OK,
+        'total': total,
+        'created': created,
+        'failed': failed,
+        'errors': errors,
+    }
+
+@router.post('/reserve')
+async def reserve_stock(db: Annotated[AsyncSession, Depends(get_db)],
+                        get_user: Annotated[dict, Depends(check_user_permissions(['is_customer']))],
+                        reservation: ReserveStock):
+    """ Списание остатков всех позиций в одной транзакции или отказ целиком (409); возврата остатков нет """
+    quantities: dict[int, int] = {}
+    for item in reservation.items:
+        quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+    reserved = []
+    # Строки блокируются в порядке возрастания id: встречные заказы не могут взаимно заблокироваться
+    for product_id in sorted(quantities):
+        quantity = quantities[product_id]
+        stock = await db.scalar(
+            update(Product)
+            .where(Product.id == product_id, Product.is_active == True, Product.stock >= quantity)
+            .values(stock=Product.stock - quantity)
+            .returning(Product.stock)
         )
-    await db.execute(insert(Product).values(
-        name=create_prod.name,
-        slug=slugify(create_prod.name),
-        price=create_prod.price,
-        description=create_prod.description,
-        is_active=True,
-        rating=0.0,
-        image_url=create_prod.image_url,
-        stock=create_prod.stock,
-        category_id=create_prod.category_id,
-        supplier_id=get_user.get('id'),
-    ))
+        if stock is None:
+            await db.rollback()
+            available = await db.scalar(select(Product.stock).where(Product.id == product_id,
+                                                                    Product.is_active == True))
+            if available is None:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                                    detail=f'Product {product_id} not found')
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail={'message': 'Insufficient stock', 'product_id': product_id,
+                                        'requested': quantity, 'available': available})
+        reserved.append({'product_id': product_id, 'stock': stock})
+
     await db.commit()
+    # Кэш списков сбрасывается, только когда товар закончился и выпал из выдачи stock > 0;
+    # остаток в закэшированных ответах может отставать на время жизни кэша. Агрегаты категорий от остатка не зависят
+    if any(item['stock'] == 0 for item in reserved):
+        await invalidate_products(rollups=False)
     return {
-        'status_code': status.HTTP_201_CREATED,
+        'status_code': status.HTTP_200_OK,
         'transaction': 'success',
+        'items': reserved,
     }
 
-@router.get('/{category_slug}')
-async def get_product_by_cat(db:Annotated[AsyncSession, Depends(get_db)],
-                            get_user: Annotated[dict, Depends(get_current_user)],
-                            category_slug: str):
-    category = await db.scalar(select(Category).where(Category.slug == category_slug))
-    if category is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Category not found")
-    all_categories = [category.id]
-    subcategories = [category.id]
-    while True:
-        subcategories = await db.scalars(select(Category.id).where(Category.parent_id.in_(subcategories)))
-        subcategories = subcategories.all()
-        if len(subcategories) == 0: break
-        all_categories.extend(subcategories)
+async def _stream_partitions(stmt: Select) -> AsyncIterator[list]:
+    # Своя сессия: зависимость get_db закрывается раньше, чем отдается тело ответа
+    async with async_read_session_marker() as session:
+        result = await session.stream(stmt.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for rows in result.mappings().partitions():
+            yield rows
 
-    products = await db.scalars(select(Product).where(
-        Product.is_active==True, Product.stock>0, Product.category_id.in_(all_categories)))
 
-    return products.all()
+@router.get('/export')
+async def export_products(db: Annotated[AsyncSession, Depends(get_read_db)],
+                          get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))],
+                          format: Literal['ndjson', 'csv'] = 'ndjson', category_slug: str | None = None,
+                          is_active: bool | None = True, in_stock: bool | None = None, gzip: bool = False):
+    """ Выгрузка каталога серверным курсором с постоянным расходом памяти """
+    columns = resolve_columns(Product, None)
+    stmt = select(*(getattr(Product, column) for column in columns)).order_by(Product.id)
+    if is_active is not None:
+        stmt = stmt.where(Product.is_active == is_active)
+    if in_stock is not None:
+        # Товар без указанного остатка считается отсутствующим, а не выпадает из обеих выборок
+        stmt = stmt.where(Product.stock > 0 if in_stock else or_(Product.stock <= 0, Product.stock.is_(None)))
+    if category_slug is not None:
+        stmt = stmt.where(Product.category_id.in_(await _category_subtree(db, category_slug)))
 
+    # gzip отдается файлом .gz без Content-Encoding: иначе клиенты распакуют его сами и сохранят текст под именем .gz
+    media_type = 'text/csv' if format == 'csv' else 'application/x-ndjson'
+    filename = f'products.{format}'
+    if gzip:
+        media_type = 'application/gzip'
+        filename += '.gz'
+    return StreamingResponse(
+        encode_stream(_stream_partitions(stmt), format, columns, compress=gzip),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+    )
 
-@router.get('/details/{product_slug}')
-async def get_product(db: Annotated[AsyncSession, Depends(get_db)],
-                        get_user: Annotated[dict, Depends(get_current_user)], product_slug: str):
-    product = await db.scalar(select(Product).where(Product.slug == product_slug))
-    if product is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f'Product {product_slug} not found'
+
+@router.get('/search', response_model=Page[ProductSearchOut])
+async def search_products(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)],
+                          get_user: Annotated[dict, Depends(get_current_user)],
+                          page: Annotated[PageParams, Depends()],
+                          q: Annotated[str, Query(min_length=1, max_length=200)],
+                          filters: Annotated[ProductFilters, Depends()],
+                          category_slug: str | None = None, in_stock: bool = True, sort: str = '-rank'):
+    """ Полнотекстовый поиск по названию и описанию с устойчивостью к опечаткам (pg_trgm) """
+    async def load():
+        query = func.websearch_to_tsquery('simple', q)
+        rank = (func.ts_rank_cd(Product.search_vector, query, type_=Float)
+                + func.similarity(Product.name, q, type_=Float))
+        where = [Product.is_active == True, or_(Product.search_vector.op('@@')(query), Product.name.op('%')(q)),
+                 *filters.clauses()]
+        if in_stock:
+            where.append(Product.stock > 0)
+        if category_slug is not None:
+            where.append(Product.category_id.in_(await _category_subtree(db, category_slug)))
+
+        return await paginate(db, Product, *where, page=page, sort=PRODUCT_SORT_ALIASES.get(sort, sort),
+                              sortable=('rank', *PRODUCT_SORT_KEYS), expressions={'rank': rank})
+
+    return await response_cache.respond(request, ('product', 'category'), load, encode_search_results)
+
+
+@router.get('/facets')
+async def get_product_facets(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)],
+                             get_user: Annotated[dict, Depends(get_current_user)],
+                             filters: Annotated[ProductFilters, Depends()], category_slug: str | None = None):
+    """ Количество товаров по категориям и ценовым диапазонам одним запросом с GROUPING SETS """
+    async def load():
+        where = [Product.is_active == True, Product.stock > 0, *filters.clauses()]
+        if category_slug is not None:
+            where.append(Product.category_id.in_(await _category_subtree(db, category_slug)))
+        bucket = case(
+            *((Product.price < upper, index) for index, upper in enumerate(PRICE_BUCKETS[1:])),
+            else_=len(PRICE_BUCKETS) - 1,
+        ).label('price_bucket')
+        matched = select(Product.category_id, bucket).where(*where).subquery()
+        rows = await db.execute(
+            select(matched.c.category_id, matched.c.price_bucket,
+                   func.grouping(matched.c.category_id).label('by_price'), func.count().label('count'))
+            .group_by(func.grouping_sets(tuple_(matched.c.category_id), tuple_(matched.c.price_bucket)))
         )
+        categories, prices = [], []
+        for row in rows:
+            if row.by_price:
+                lower = PRICE_BUCKETS[row.price_bucket]
+                upper = PRICE_BUCKETS[row.price_bucket + 1] if row.price_bucket + 1 < len(PRICE_BUCKETS) else None
+                prices.append({'min': lower, 'max': upper, 'count': row.count})
+            else:
+                categories.append({'category_id': row.category_id, 'count': row.count})
+        return {
+            'total': sum(category['count'] for category in categories),
+            'categories': sorted(categories, key=lambda category: -category['count']),
+            'price_buckets': sorted(prices, key=lambda price: price['min']),
+        }
 
-    return product
+    return await response_cache.respond(request, ('product', 'category'), load)
+
+
+@router.get('/{category_slug}', response_model=Page[ProductOut])
+async def get_product_by_cat(request: Request, db:Annotated[AsyncSession, Depends(get_read_db)],
+                            get_user: Annotated[dict, Depends(get_current_user)],
+                            page: Annotated[PageParams, Depends()],
+                            filters: Annotated[ProductFilters, Depends()],
+                            category_slug: str, sort: str = 'id'):
+    async def load():
+        all_categories = await _category_subtree(db, category_slug)
+        return await paginate(db, Product, Product.is_active==True, Product.stock>0,
+                              Product.category_id.in_(all_categories), *filters.clauses(),
+                              page=page, sort=PRODUCT_SORT_ALIASES.get(sort, sort), sortable=PRODUCT_SORT_KEYS)
+
+    return await response_cache.respond(request, ('product', 'category'), load, encode_products)
+
+
+@router.get('/details/{product_slug}', response_model=ProductOut)
+async def get_product(request: Request, db: Annotated[AsyncSession, Depends(get_read_db)],
+                        get_user: Annotated[dict, Depends(get_current_user)], product_slug: str):
+    async def fetch():
+        async with detached_session(db) as session:
+            return await session.scalar(select(Product).where(Product.slug == product_slug))
+
+    async def load():
+        # Одновременные запросы одного товара ждут один SELECT
+        product = await product_flight.do((db.bind, product_slug), fetch)
+        if product is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f'Product {product_slug} not found'
+            )
+        return product
+
+    return await response_cache.respond(request, ('product',), load, encode_product)
 
 
 @router.put('/{product_slug}')
 async def update_product(db: Annotated[AsyncSession, Depends(get_db)],
                          get_user: Annotated[dict, Depends(check_user_permissions(['is_admin', 'is_supplier']))],
                          product_slug: str, create_prod: CreateProduct):
-    product = await db.scalar(select(Product).where(Product.slug == product_slug))
-    if product is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f'Product {product_slug} not found'
+    # Один UPDATE ... RETURNING: права проверяются в WHERE, категория - внешним ключом
+    try:
+        product_id = await db.scalar(
+            update(Product).where(Product.slug == product_slug, _owned_by(get_user)).values(
+                name=create_prod.name,
+                description=create_prod.description,
+                slug=slugify(create_prod.name),
+                is_active=True,
+                price=create_prod.price,
+                image_url=create_prod.image_url,
+                stock=create_prod.stock,
+                category_id=create_prod.category_id,
+            ).returning(Product.id)
         )
-    if product.id != get_user.get('id') and not get_user.get('is_admin'):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail='Permission denied'
-        )
-    category = await db.scalar(select(Category).where(Category.id == create_prod.category))
-    if category is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail='There is no category found'
-        )
-    product.name = create_prod.name
-    product.description = create_prod.description
-    product.slug = slugify(create_prod.name)
-    product.is_active = True
-    product.rating = create_prod.rating
-    product.image_url = create_prod.image_url
-    product.stock = create_prod.stock
-    product.category_id = create_prod.category
+    except IntegrityError as exc:
+        await db.rollback()
+        raise _integrity_http_error(exc)
+    if product_id is None:
+        raise await _write_denied(db, product_slug)
 
     await db.commit()
+    await invalidate_products()
     return {
         'status_code': status.HTTP_200_OK,
         'transaction': 'success',
@@ -125,22 +498,15 @@ async def update_product(db: Annotated[AsyncSession, Depends(get_db)],
 async def delete_product(db: Annotated[AsyncSession, Depends(get_db)],
                          get_user: Annotated[dict, Depends(check_user_permissions(['is_admin', 'is_supplier']))],
                          product_slug: str):
-    product = await db.scalar(select(Product).where(Product.slug == product_slug))
-    if product is None:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f'Product {product_slug} not found'
-        )
-
-    if product.id != get_user.get('id') and not get_user.get('is_admin'):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail='Permission denied'
-        )
-
-    product.is_active = False
+    product_id = await db.scalar(
+        update(Product).where(Product.slug == product_slug, _owned_by(get_user))
+        .values(is_active=False).returning(Product.id)
+    )
+    if product_id is None:
+        raise await _write_denied(db, product_slug)
 
     await db.commit()
+    await invalidate_products()
     return {
         'status_code': status.HTTP_200_OK,
         'transaction': 'success',
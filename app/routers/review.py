@@ -1,43 +1,109 @@
+import logging
+import os
 from datetime import datetime
 from typing import Annotated
 
 from fastapi import APIRouter, HTTPException
+from fastapi.encoders import jsonable_encoder
 from fastapi.params import Depends
-from sqlalchemy import select, insert
+from fastapi.responses import JSONResponse
+from sqlalchemy import select, insert, not_, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from app.backend.db_depends import get_db
+from app.backend.batching import BatchQueue
+from app.backend.db import async_session_marker
+from app.backend.db_depends import get_db, get_read_db
+from app.backend.serialization import SchemaEncoder
+from app.backend.singleflight import detached_session, invalidate_products, review_flight
 from app.models import Product
 from app.models.review import Review
 from app.routers.auth import get_current_user
-from app.routers.services import check_user_permissions, calculate_rank
-from app.schemas import CreateReview
+from app.routers.pagination import PageParams, paginate
+from app.routers.services import check_user_permissions, rating_update, rating_update_many, recompute_ratings
+from app.schemas import CreateReview, Page, ReviewOut
 
-router = APIRouter(prefix='/reviews', tags=['review'])
+logger = logging.getLogger(__name__)
 
-@router.get('/')
-async def get_all_reviews(db: Annotated[AsyncSession,Depends(get_db)],
-                          get_user: Annotated[dict, Depends(get_current_user)]):
-    reviews = await db.scalars(select(Review).where(Review.is_active == True))
-    return reviews.all()
+router = APIRouter(prefix='/reviews', tags=['review'])
 
-@router.get('/{product_slug}')
-async def get_reviews_by_product(db: Annotated[AsyncSession, Depends(get_db)],
+encode_reviews = SchemaEncoder(Page[ReviewOut])
+
+# sync - отзыв записывается в запросе; queue - принимается в очередь (202) и пишется пачками
+REVIEW_INGEST_MODE = os.environ.get('REVIEW_INGEST_MODE', 'sync')
+REVIEW_QUEUE_SIZE = int(os.environ.get('REVIEW_QUEUE_SIZE', 10_000))
+# 5 параметров на строку: 1000 строк укладываются в лимит параметров одного запроса
+REVIEW_BATCH_SIZE = int(os.environ.get('REVIEW_BATCH_SIZE', 1000))
+REVIEW_FLUSH_MS = int(os.environ.get('REVIEW_FLUSH_MS', 200))
+# Пачка пишется одной транзакцией, поэтому неудачный сброс можно повторить целиком
+REVIEW_FLUSH_RETRIES = int(os.environ.get('REVIEW_FLUSH_RETRIES', 3))
+REVIEW_RETRY_BACKOFF_MS = int(os.environ.get('REVIEW_RETRY_BACKOFF_MS', 100))
+
+
+async def _flush_reviews(batch: list[dict]) -> None:
+    """ Пачка отзывов одной транзакцией: один UPDATE рейтингов по продуктам и один многострочный INSERT """
+    deltas: dict[int, tuple[int, int]] = {}
+    for review in batch:
+        grade, count = deltas.get(review['product_id'], (0, 0))
+        deltas[review['product_id']] = (grade + review['grade'], count + 1)
+
+    async with async_session_marker() as db:
+        # RETURNING отдает только существующие продукты, отзывы к остальным отбрасываются
+        existing = set(await db.scalars(rating_update_many(deltas).returning(Product.id)))
+        rows = [review for review in batch if review['product_id'] in existing]
+        if rows:
+            await db.execute(insert(Review).values(rows))
+        await db.commit()
+    await invalidate_products()
+    if len(rows) < len(batch):
+        logger.warning('Dropped %d queued reviews for missing products', len(batch) - len(rows))
+
+
+review_queue = (BatchQueue(_flush_reviews, REVIEW_QUEUE_SIZE, REVIEW_BATCH_SIZE, REVIEW_FLUSH_MS / 1000,
+                           REVIEW_FLUSH_RETRIES, REVIEW_RETRY_BACKOFF_MS / 1000)
+                if REVIEW_INGEST_MODE == 'queue' else None)
+
+@router.get('/', response_model=Page[ReviewOut])
+async def get_all_reviews(db: Annotated[AsyncSession,Depends(get_read_db)],
+                          get_user: Annotated[dict, Depends(get_current_user)],
+                          page: Annotated[PageParams, Depends()]):
+    return encode_reviews.response(await paginate(db, Review, Review.is_active == True, page=page))
+
+@router.get('/{product_slug}', response_model=Page[ReviewOut])
+async def get_reviews_by_product(db: Annotated[AsyncSession, Depends(get_read_db)],
                                  get_user: Annotated[dict, Depends(get_current_user)],
+                                 page: Annotated[PageParams, Depends()],
                                  product_slug: str):
-    product = await db.scalar(select(Product).where(Product.slug == product_slug))
-    if product is None:
-        raise HTTPException(status_code=404, detail='Product not found')
-    reviews = await db.scalars(select(Review).where(Review.product_id == product.id, Review.is_active == True))
-    return reviews.all()
+    async def load():
+        async with detached_session(db) as session:
+            # Соединение с product по slug в том же запросе; товар проверяется только при пустой первой странице
+            reviews = await paginate(session, Review, Review.product_id == Product.id, Product.slug == product_slug,
+                                     Review.is_active == True, page=page)
+            if not reviews['items'] and page.cursor is None:
+                if await session.scalar(select(Product.id).where(Product.slug == product_slug)) is None:
+                    raise HTTPException(status_code=404, detail='Product not found')
+        return reviews
+
+    key = (db.bind, product_slug, page.cursor, page.limit, tuple(page.fields or ()))
+    return encode_reviews.response(await review_flight.do(key, load))
 
 @router.post('/', status_code=status.HTTP_201_CREATED)
 async def create_review(db: Annotated[AsyncSession, Depends(get_db)],
                         get_user: Annotated[dict, Depends(check_user_permissions(['is_supplier']))],
                         new_review: CreateReview):
-    product = await db.scalar(select(Product).where(Product.id == new_review.product_id))
-    if product is None:
+    if review_queue is not None:
+        review_queue.put({
+            'user_id': get_user.get('id'),
+            'product_id': new_review.product_id,
+            'comment': new_review.comment,
+            'comment_date': datetime.now(),
+            'grade': new_review.grade,
+        })
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder(new_review))
+
+    product_id = await db.scalar(
+        rating_update(new_review.product_id, new_review.grade, 1).returning(Product.id))
+    if product_id is None:
         raise HTTPException(status_code=404, detail='Product not found')
     await db.execute(insert(Review).values(
         user_id = get_user.get('id'),
@@ -47,10 +113,8 @@ async def create_review(db: Annotated[AsyncSession, Depends(get_db)],
         grade = new_review.grade,
     ))
 
-    product.rating = await calculate_rank(product, True, new_review.grade)
-    product.reviews_count += 1
-
     await db.commit()
+    await invalidate_products()
 
     return new_review
 
@@ -58,29 +122,36 @@ async def create_review(db: Annotated[AsyncSession, Depends(get_db)],
 async def delete_review(db: Annotated[AsyncSession, Depends(get_db)],
                         get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))],
                         review_id: int):
-    review = await db.scalar(select(Review).where(Review.id == review_id))
+    # Переключение флага и пересчет агрегатов без чтения строк: оба UPDATE атомарны
+    review = (await db.execute(
+        update(Review).where(Review.id == review_id).values(is_active=not_(Review.is_active))
+        .returning(Review.product_id, Review.grade, Review.is_active)
+    )).one_or_none()
     if review is None:
         raise HTTPException(status_code=404, detail='Review not found')
 
-    product = await db.scalar(select(Product).where(Product.id == review.product_id))
-    if product is None:
-        raise HTTPException(status_code=404, detail='Product not found')
-
-    product.rating = await calculate_rank(product, not review.is_active, review.grade)
-
     if review.is_active:
-        review.is_active = False
-        message=''
-        product.reviews_count -= 1
-    else:
-        review.is_active = True
         message='un'
-        product.reviews_count += 1
-
+        await db.execute(rating_update(review.product_id, review.grade, 1))
+    else:
+        message=''
+        await db.execute(rating_update(review.product_id, -review.grade, -1))
 
     await db.commit()
+    await invalidate_products()
 
     return {
         'status_code': status.HTTP_200_OK,
         'message': f'Review {message}deleted',
-    }
\ No newline at end of file
+    }
+
+@router.post('/recompute_ratings')
+async def recompute_product_ratings(db: Annotated[AsyncSession, Depends(get_db)],
+                                    get_user: Annotated[dict, Depends(check_user_permissions(['is_admin']))]):
+    products = await recompute_ratings(db)
+    await db.commit()
+    await invalidate_products()
+    return {
+        'status_code': status.HTTP_200_OK,
+        'products': products,
+    }
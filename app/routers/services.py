@@ -1,33 +1,101 @@
 from typing import Annotated, Callable
+from uuid import uuid4
+
 from fastapi import Depends, HTTPException
+from slugify import slugify
+from sqlalchemy import Float, Integer, Update, and_, case, cast, column, func, select, update, values
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from app.models import Product
+from app.models import Product, Review
 from app.routers.auth import get_current_user
 
 
+FOREIGN_KEY_VIOLATION = '23503'
+UNIQUE_VIOLATION = '23505'
+
+
+def integrity_error_code(exc: IntegrityError) -> str | None:
+    """ SQLSTATE нарушения ограничения, чтобы отличать FK от уникальности """
+    return getattr(exc.orig, 'sqlstate', None) or getattr(exc.orig, 'pgcode', None)
+
+
 def check_user_permissions(permissions: list[str]) -> Callable:
     """ Фабрика зависимостей для проверки прав пользователей """
     async def dependency(get_user: Annotated[dict, Depends(get_current_user)]) -> dict:
-        for permission in permissions:
-            if not get_user.get(permission):
-                raise HTTPException(
-                    status_code=status.HTTP_403_FORBIDDEN,
-                    detail='Permission denied'
-                )
-            else:
-                return get_user
+        # Достаточно любой из перечисленных ролей
+        if not any(get_user.get(permission) for permission in permissions):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail='Permission denied'
+            )
+        return get_user
 
     return dependency
 
-async def calculate_rank(product: Product, add: bool, grade: int) -> float:
-    """ Подсчет рейтинга продукта при добавлении оценки """
-    reviews_count = product.reviews_count or 0
-    if add:
-        new_rating = (product.rating * reviews_count + grade)/(reviews_count + 1)
-    else:
-        try:
-            new_rating = (product.rating * reviews_count) - grade/(reviews_count - 1)
-        except ZeroDivisionError:
-            new_rating = 0
-    return new_rating
\ No newline at end of file
+def _rating_values(grade_delta, count_delta) -> dict:
+    rating_sum = Product.rating_sum + grade_delta
+    reviews_count = Product.reviews_count + count_delta
+    return {
+        'rating_sum': rating_sum,
+        'reviews_count': reviews_count,
+        'rating': case((reviews_count > 0, cast(rating_sum, Float) / reviews_count), else_=0.0),
+    }
+
+def rating_update(product_id: int, grade_delta: int, count_delta: int) -> Update:
+    """ Атомарное изменение агрегатов рейтинга одним UPDATE без чтения продукта """
+    return update(Product).where(Product.id == product_id).values(**_rating_values(grade_delta, count_delta))
+
+def rating_update_many(deltas: dict[int, tuple[int, int]]) -> Update:
+    """ Изменение рейтингов нескольких продуктов одним UPDATE ... FROM (VALUES ...): {id: (оценки, отзывы)} """
+    rows = values(column('product_id', Integer), column('grade_delta', Integer), column('count_delta', Integer),
+                  name='delta').data([(product_id, grade, count) for product_id, (grade, count) in deltas.items()])
+    return (update(Product).where(Product.id == rows.c.product_id)
+            .values(**_rating_values(rows.c.grade_delta, rows.c.count_delta)))
+
+async def recompute_ratings(db: AsyncSession) -> int:
+    """ Пересчет рейтингов всего каталога по таблице review одним запросом """
+    totals = (
+        select(
+            Product.id.label('product_id'),
+            func.coalesce(func.sum(Review.grade), 0).label('rating_sum'),
+            func.count(Review.id).label('reviews_count'),
+        )
+        .outerjoin(Review, and_(Review.product_id == Product.id, Review.is_active == True))
+        .group_by(Product.id)
+        .subquery()
+    )
+    result = await db.execute(update(Product).where(Product.id == totals.c.product_id).values(
+        rating_sum=totals.c.rating_sum,
+        reviews_count=totals.c.reviews_count,
+        rating=case((totals.c.reviews_count > 0, cast(totals.c.rating_sum, Float) / totals.c.reviews_count),
+                    else_=0.0),
+    ))
+    return result.rowcount
+
+async def allocate_slugs(db: AsyncSession, names: list[str], taken: set[str], attempts: int = 5) -> list[str]:
+    """ Уникальные слаги для пачки названий: один запрос IN на каждую попытку суффикса """
+    bases = [slugify(name) for name in names]
+    slugs = [''] * len(names)
+    pending = list(range(len(names)))
+    attempt = 1
+    while pending:
+        candidates = {}
+        for index in pending:
+            if attempt == 1:
+                candidates[index] = bases[index]
+            elif attempt <= attempts:
+                candidates[index] = f'{bases[index]}-{attempt}'
+            else:
+                candidates[index] = f'{bases[index]}-{uuid4().hex[:8]}'
+        existing = set(await db.scalars(select(Product.slug).where(Product.slug.in_(set(candidates.values())))))
+        pending = []
+        for index, candidate in candidates.items():
+            if candidate in existing or candidate in taken:
+                pending.append(index)
+            else:
+                taken.add(candidate)
+                slugs[index] = candidate
+        attempt += 1
+    return slugs
@@ -1,6 +1,7 @@
-from typing import Optional
+from datetime import datetime
+from typing import Generic, Optional, TypeVar
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class CreateCategory(BaseModel):
@@ -23,9 +24,78 @@ class CreateUser(BaseModel):
     email: str
     password: str
 
+class CreateUsers(BaseModel):
+    users: list[CreateUser] = Field(min_length=1, max_length=5000)
+    is_supplier: bool = False
+
+class BulkPermission(BaseModel):
+    user_ids: list[int] = Field(min_length=1, max_length=5000)
+    is_supplier: bool
+
+class BulkUsers(BaseModel):
+    user_ids: list[int] = Field(min_length=1, max_length=5000)
+
+class RefreshToken(BaseModel):
+    refresh_token: str
+
 class CreateReview(BaseModel):
     product_id: int
     comment: str
     grade: int
 
+class ReserveItem(BaseModel):
+    product_id: int
+    quantity: int = Field(gt=0)
+
+class ReserveStock(BaseModel):
+    items: list[ReserveItem] = Field(min_length=1, max_length=100)
+
+
+# Схемы ответов. Поля необязательны, потому что списки поддерживают проекцию ?fields=,
+# а в JSON попадают только заполненные поля (exclude_unset)
+class ProductOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int | None = None
+    name: str | None = None
+    description: str | None = None
+    slug: str | None = None
+    is_active: bool | None = None
+    price: float | None = None
+    image_url: str | None = None
+    stock: int | None = None
+    rating: float | None = None
+    rating_sum: int | None = None
+    reviews_count: int | None = None
+    category_id: int | None = None
+    supplier_id: int | None = None
+
+class ProductSearchOut(ProductOut):
+    rank: float | None = None
+
+class CategoryOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int | None = None
+    name: str | None = None
+    slug: str | None = None
+    is_active: bool | None = None
+    parent_id: int | None = None
+
+class ReviewOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int | None = None
+    user_id: int | None = None
+    product_id: int | None = None
+    comment: str | None = None
+    comment_date: datetime | None = None
+    grade: int | None = None
+    is_active: bool | None = None
+
+
+Item = TypeVar('Item')
 
+class Page(BaseModel, Generic[Item]):
+    items: list[Item]
+    next_cursor: str | None = None
@@ -0,0 +1,50 @@
+""" Сравнение двух файлов результатов benchmarks.run: python -m benchmarks.compare old.json new.json """
+import argparse
+import json
+import sys
+
+METRICS = ('rps', 'p50_ms', 'p95_ms', 'p99_ms')
+
+
+def change(old: float, new: float) -> float:
+    return (new - old) / old * 100 if old else 0.0
+
+
+def compare(old: dict, new: dict, threshold: float) -> list[str]:
+    """ Печатает таблицу изменений и возвращает сценарии, которые ухудшились больше порога (в процентах) """
+    regressions = []
+    for report in (old, new):
+        print(f'{report.get("commit")}: {report.get("mode")}, {report.get("workers")} worker(s), '
+              f'{report.get("concurrency")} concurrent, catalog {report.get("catalog")}')
+    for name, result in new['scenarios'].items():
+        baseline = old['scenarios'].get(name)
+        if baseline is None:
+            print(f'{name:<28} new')
+            continue
+        cells = []
+        regressed = False
+        for metric in METRICS:
+            delta = change(baseline[metric], result[metric])
+            # Для RPS хуже - меньше, для задержек - больше
+            worse = -delta if metric == 'rps' else delta
+            regressed |= worse > threshold
+            cells.append(f'{metric} {baseline[metric]:>9.2f} -> {result[metric]:>9.2f} ({delta:+6.1f}%)')
+        print(f'{name:<28} ' + '  '.join(cells) + ('  REGRESSION' if regressed else ''))
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Compare two benchmark result files')
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help='allowed slowdown in percent')
+    args = parser.parse_args(argv)
+    with open(args.old) as old, open(args.new) as new:
+        regressions = compare(json.load(old), json.load(new), args.threshold)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
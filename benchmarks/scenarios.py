@@ -0,0 +1,73 @@
+import random
+from dataclasses import dataclass, field
+from typing import Callable
+
+from benchmarks.seed import ADMIN_USERNAME, HOT_PRODUCT_ID, PASSWORD, VOCABULARY, Catalog
+
+
+@dataclass
+class Context:
+    """ Данные для построения запросов: каталог, заголовок авторизации и генератор случайных чисел """
+    catalog: Catalog
+    headers: dict = field(default_factory=dict)
+    rng: random.Random = field(default_factory=lambda: random.Random(0))
+
+    def product(self) -> str:
+        return self.rng.choice(self.catalog.product_slugs)
+
+    def category(self) -> str:
+        return self.rng.choice(self.catalog.category_slugs)
+
+    def word(self) -> str:
+        return self.rng.choice(VOCABULARY)
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """ Один замеряемый эндпоинт: request(ctx) возвращает аргументы для httpx.AsyncClient.request """
+    name: str
+    request: Callable[[Context], dict]
+    expect: tuple[int, ...] = (200,)
+
+
+def _get(path: Callable[[Context], str]) -> Callable[[Context], dict]:
+    return lambda ctx: {'method': 'GET', 'url': path(ctx), 'headers': ctx.headers}
+
+
+SCENARIOS = [
+    Scenario('categories.list', _get(lambda ctx: '/categories/')),
+    Scenario('categories.tree', _get(lambda ctx: '/categories/tree')),
+    Scenario('products.list', _get(lambda ctx: '/products/')),
+    Scenario('products.list_by_price', _get(lambda ctx: '/products/?sort=price&limit=50')),
+    Scenario('products.by_category', _get(lambda ctx: f'/products/{ctx.category()}')),
+    Scenario('products.details', _get(lambda ctx: f'/products/details/{ctx.product()}')),
+    Scenario('products.search', _get(lambda ctx: f'/products/search?q={ctx.word()}')),
+    Scenario('products.facets', _get(lambda ctx: f'/products/facets?category_slug={ctx.rng.choice(ctx.catalog.root_slugs)}')),
+    Scenario('reviews.list', _get(lambda ctx: '/reviews/')),
+    Scenario('reviews.by_product', _get(lambda ctx: f'/reviews/{ctx.product()}')),
+    Scenario('auth.current_user', _get(lambda ctx: '/auth/read_current_user')),
+    Scenario('auth.token', lambda ctx: {
+        'method': 'POST', 'url': '/auth/token',
+        'data': {'username': ctx.rng.choice(ctx.catalog.usernames), 'password': PASSWORD},
+    }),
+    Scenario('reviews.create', lambda ctx: {
+        'method': 'POST', 'url': '/reviews/', 'headers': ctx.headers,
+        'json': {'product_id': ctx.rng.randint(1, ctx.catalog.params.products),
+                 'comment': 'benchmark', 'grade': ctx.rng.randint(1, 5)},
+    }, expect=(201,)),
+    # Все запросы бьют в одну строку: замер пропускной способности под блокировкой горячего товара
+    Scenario('products.reserve_hot', lambda ctx: {
+        'method': 'POST', 'url': '/products/reserve', 'headers': ctx.headers,
+        'json': {'items': [{'product_id': HOT_PRODUCT_ID, 'quantity': 1}]},
+    }),
+    # Горячий товар плюс случайные: остатки случайных могут закончиться (409), часть товаров неактивна (404)
+    Scenario('products.reserve_basket', lambda ctx: {
+        'method': 'POST', 'url': '/products/reserve', 'headers': ctx.headers,
+        'json': {'items': [{'product_id': HOT_PRODUCT_ID, 'quantity': 1}] + [
+            {'product_id': ctx.rng.randint(1, ctx.catalog.params.products), 'quantity': 1} for _ in range(3)]},
+    }, expect=(200, 404, 409)),
+]
+
+
+def admin_credentials() -> dict:
+    return {'username': ADMIN_USERNAME, 'password': PASSWORD}
@@ -0,0 +1,155 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection, create_async_engine
+
+ROOT = Path(__file__).resolve().parent.parent
+PASSWORD = 'bench-password'
+ADMIN_USERNAME = 'bench-admin'
+INSERT_BATCH = 1000
+# Товар с большим остатком для замеров конкурентного списания
+HOT_PRODUCT_ID = 1
+VOCABULARY = (
+    'steel', 'oak', 'linen', 'wireless', 'compact', 'classic', 'garden', 'kitchen', 'travel', 'sport',
+    'vintage', 'smart', 'cotton', 'leather', 'ceramic', 'portable', 'premium', 'mini', 'family', 'outdoor',
+)
+
+
+@dataclass(frozen=True)
+class CatalogParams:
+    """ Размер синтетического каталога; при одинаковых параметрах данные совпадают """
+    depth: int = 3
+    fanout: int = 4
+    products: int = 10_000
+    reviews: int = 50_000
+    users: int = 100
+    hot_stock: int = 1_000_000
+    seed: int = 42
+
+
+@dataclass
+class Catalog:
+    """ Слаги и логины, по которым сценарии строят запросы, без обращения к базе """
+    params: CatalogParams
+    category_slugs: list[str] = field(default_factory=list)
+    root_slugs: list[str] = field(default_factory=list)
+    product_slugs: list[str] = field(default_factory=list)
+    usernames: list[str] = field(default_factory=list)
+
+    @classmethod
+    def build(cls, params: CatalogParams) -> 'Catalog':
+        catalog = cls(params)
+        for path, _ in _category_paths(params):
+            slug = 'category-' + '-'.join(map(str, path))
+            catalog.category_slugs.append(slug)
+            if len(path) == 1:
+                catalog.root_slugs.append(slug)
+        catalog.product_slugs = [f'product-{number}' for number in range(1, params.products + 1)]
+        catalog.usernames = [ADMIN_USERNAME] + [f'bench-user-{number}' for number in range(1, params.users + 1)]
+        return catalog
+
+
+def _category_paths(params: CatalogParams) -> list[tuple[tuple[int, ...], tuple[int, ...] | None]]:
+    """ Дерево категорий в ширину: (путь узла, путь родителя) """
+    paths = []
+    level = [((number,), None) for number in range(1, params.fanout + 1)]
+    for _ in range(params.depth):
+        paths.extend(level)
+        level = [((*path, number), path) for path, _ in level for number in range(1, params.fanout + 1)]
+    return paths
+
+
+def migrate(database_url: str, reset: bool = True) -> None:
+    """ Схема создается миграциями Alembic, как в рабочем окружении """
+    import asyncio
+
+    async def drop_schema():
+        engine = create_async_engine(database_url)
+        async with engine.begin() as conn:
+            await conn.execute(text('DROP SCHEMA public CASCADE'))
+            await conn.execute(text('CREATE SCHEMA public'))
+        await engine.dispose()
+
+    if reset:
+        asyncio.run(drop_schema())
+    config = Config(str(ROOT / 'alembic.ini'))
+    config.set_main_option('sqlalchemy.url', database_url)
+    command.upgrade(config, 'head')
+
+
+async def _insert(conn: AsyncConnection, table, rows: list[dict]) -> None:
+    for start in range(0, len(rows), INSERT_BATCH):
+        await conn.execute(insert(table), rows[start:start + INSERT_BATCH])
+
+
+async def _sync_sequence(conn: AsyncConnection, table: str) -> None:
+    await conn.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), (SELECT max(id) FROM \"{table}\"))"
+    ))
+
+
+async def seed(database_url: str, params: CatalogParams) -> Catalog:
+    """ Заполнение базы пачками INSERT; рейтинги пересчитываются одним запросом в конце """
+    from app.backend.hashing import bcrypt_context
+    from app.models import Category, Product, Review, User
+    from app.routers.services import recompute_ratings
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    rng = random.Random(params.seed)
+    catalog = Catalog.build(params)
+    # Один хэш на всех: стоимость bcrypt такая же, как у настоящих пользователей
+    hashed_password = bcrypt_context.hash(PASSWORD)
+
+    users = [
+        {'id': number, 'first_name': 'Bench', 'last_name': str(number), 'username': username,
+         'email': f'{username}@bench.local', 'hashed_password': hashed_password, 'is_active': True,
+         'is_admin': number == 1, 'is_supplier': number == 1, 'is_customer': True}
+        for number, username in enumerate(catalog.usernames, start=1)
+    ]
+
+    paths = _category_paths(params)
+    category_ids = {path: number for number, (path, _) in enumerate(paths, start=1)}
+    categories = [
+        {'id': category_ids[path], 'name': 'Category ' + '.'.join(map(str, path)), 'slug': slug,
+         'is_active': True, 'parent_id': category_ids[parent] if parent else None}
+        for (path, parent), slug in zip(paths, catalog.category_slugs)
+    ]
+
+    products = []
+    for number, slug in enumerate(catalog.product_slugs, start=1):
+        words = rng.sample(VOCABULARY, 4)
+        products.append({
+            'id': number, 'name': f'{words[0].title()} {words[1]} {number}', 'slug': slug,
+            'description': ' '.join(words), 'is_active': rng.random() > 0.02,
+            'price': round(rng.uniform(1, 1500), 2), 'stock': rng.randint(0, 100),
+            'rating': 0.0, 'rating_sum': 0, 'reviews_count': 0,
+            'category_id': rng.randint(1, len(categories)), 'supplier_id': 1,
+        })
+    products[HOT_PRODUCT_ID - 1].update(is_active=True, stock=params.hot_stock)
+
+    started = datetime.now() - timedelta(days=365)
+    reviews = [
+        {'id': number, 'user_id': rng.randint(1, len(users)), 'product_id': rng.randint(1, len(products)),
+         'comment': ' '.join(rng.sample(VOCABULARY, 3)), 'grade': rng.randint(1, 5), 'is_active': True,
+         'comment_date': started + timedelta(minutes=number)}
+        for number in range(1, params.reviews + 1)
+    ]
+
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        for model, rows in ((User, users), (Category, categories), (Product, products), (Review, reviews)):
+            await _insert(conn, model.__table__, rows)
+            await _sync_sequence(conn, model.__tablename__)
+    async with AsyncSession(engine) as session:
+        await recompute_ratings(session)
+        await session.commit()
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level='AUTOCOMMIT')
+        await conn.execute(text('VACUUM ANALYZE'))
+    await engine.dispose()
+    return catalog
@@ -0,0 +1,90 @@
+""" Стоимость кодирования одного элемента ответа: python -m benchmarks.serialization --items 500 """
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.backend.serialization import SchemaEncoder
+from app.models import Product
+from app.schemas import Page, ProductOut, ReviewOut
+from benchmarks.seed import VOCABULARY
+
+
+def product_rows(count: int, rng: random.Random) -> list[dict]:
+    return [
+        {'id': number, 'name': f'{rng.choice(VOCABULARY).title()} {number}', 'slug': f'product-{number}',
+         'description': ' '.join(rng.sample(VOCABULARY, 4)), 'is_active': True,
+         'price': Decimal(f'{rng.uniform(1, 1500):.2f}'), 'image_url': None, 'stock': rng.randint(0, 100),
+         'rating': rng.uniform(1, 5), 'rating_sum': rng.randint(0, 500), 'reviews_count': rng.randint(0, 100),
+         'category_id': rng.randint(1, 84), 'supplier_id': 1}
+        for number in range(1, count + 1)
+    ]
+
+
+def review_rows(count: int, rng: random.Random) -> list[dict]:
+    started = datetime(2025, 1, 1)
+    return [
+        {'id': number, 'user_id': rng.randint(1, 100), 'product_id': rng.randint(1, 10_000),
+         'comment': ' '.join(rng.sample(VOCABULARY, 3)), 'comment_date': started + timedelta(minutes=number),
+         'grade': rng.randint(1, 5), 'is_active': True}
+        for number in range(1, count + 1)
+    ]
+
+
+def per_item_microseconds(encode, value, items: int, repeat: int) -> float:
+    """ Лучшее из repeat прогонов, в микросекундах на элемент """
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        encode(value)
+        best = min(best, time.perf_counter() - started)
+    return round(best / items * 1_000_000, 3)
+
+
+def legacy_encode(value) -> bytes:
+    """ Прежний путь: jsonable_encoder обходит объект в Python, затем json.dumps """
+    return JSONResponse(jsonable_encoder(value)).body
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description='Measure per-item JSON encoding cost of list responses')
+    parser.add_argument('--items', type=int, default=500, help='items per page')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--output', type=Path)
+    args = parser.parse_args(argv)
+
+    rng = random.Random(0)
+    products = product_rows(args.items, rng)
+    cases = {
+        'products.page': (Page[ProductOut], {'items': products, 'next_cursor': 'x'}),
+        'products.page_fields': (Page[ProductOut], {'items': [{'id': row['id'], 'name': row['name'],
+                                                                'price': row['price']} for row in products],
+                                                      'next_cursor': None}),
+        'products.orm': (list[ProductOut], [Product(**row) for row in products]),
+        'reviews.page': (Page[ReviewOut], {'items': review_rows(args.items, rng), 'next_cursor': None}),
+    }
+
+    results = {}
+    for name, (schema, value) in cases.items():
+        encode = SchemaEncoder(schema)
+        if name != 'products.orm' and json.loads(encode(value)) != json.loads(legacy_encode(value)):
+            raise AssertionError(f'{name}: schema encoder output differs from jsonable_encoder')
+        legacy = per_item_microseconds(legacy_encode, value, args.items, args.repeat)
+        schema_path = per_item_microseconds(encode, value, args.items, args.repeat)
+        results[name] = {'jsonable_encoder_us': legacy, 'schema_encoder_us': schema_path,
+                         'speedup': round(legacy / schema_path, 2)}
+        print(f'{name:<24} jsonable_encoder {legacy:>8.2f} us/item  schema {schema_path:>8.2f} us/item  '
+              f'x{results[name]["speedup"]}')
+
+    if args.output:
+        args.output.write_text(json.dumps({'items': args.items, 'cases': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+from conftest import PASSWORD
+
+
+def login(client, username: str) -> dict:
+    response = client.post('/auth/token', data={'username': username, 'password': PASSWORD})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def refresh(client, tokens: dict):
+    return client.post('/auth/refresh', json={'refresh_token': tokens['refresh_token']})
+
+
+def bearer(tokens: dict) -> dict:
+    return {'Authorization': f"Bearer {tokens['access_token']}"}
+
+
+def test_refresh_rotates_tokens(client, make_user):
+    tokens = login(client, make_user()['username'])
+    response = refresh(client, tokens)
+    assert response.status_code == 200, response.text
+    rotated = response.json()
+    assert rotated['refresh_token'] != tokens['refresh_token']
+    assert client.get('/auth/read_current_user', headers=bearer(rotated)).status_code == 200
+    assert refresh(client, rotated).status_code == 200
+
+
+def test_reused_refresh_token_revokes_family(client, make_user):
+    tokens = login(client, make_user()['username'])
+    rotated = refresh(client, tokens).json()
+
+    reused = refresh(client, tokens)
+    assert reused.status_code == 401
+    assert reused.json()['detail'] == 'Refresh token has already been used'
+    # Вся цепочка отозвана, включая уже выданный по ней токен, а access-токены пользователя не принимаются
+    assert refresh(client, rotated).status_code == 401
+    assert client.get('/auth/read_current_user', headers=bearer(rotated)).status_code == 401
+
+
+def test_reuse_is_detected_without_process_state(client, make_user):
+    from app.routers import auth
+
+    tokens = login(client, make_user()['username'])
+    assert refresh(client, tokens).status_code == 200
+    # Другой воркер не видит кэшей этого процесса: повторный обмен отклоняет сама база
+    auth.token_cache.clear()
+    auth.token_epochs.clear()
+    assert refresh(client, tokens).status_code == 401
+
+
+def test_role_change_keeps_refresh_working(client, make_user, admin):
+    user = make_user()
+    tokens = login(client, user['username'])
+    response = client.patch('/permission/', params={'user_id': user['id']}, headers=admin['headers'])
+    assert response.status_code == 200, response.text
+
+    assert client.get('/auth/read_current_user', headers=bearer(tokens)).status_code == 401
+    response = refresh(client, tokens)
+    assert response.status_code == 200, response.text
+    principal = client.get('/auth/read_current_user', headers=bearer(response.json())).json()
+    assert principal['is_supplier'] is True
+
+
+def test_deactivated_user_cannot_refresh(client, make_user, admin):
+    user = make_user()
+    tokens = login(client, user['username'])
+    response = client.delete('/permission/', params={'user_id': user['id']}, headers=admin['headers'])
+    assert response.status_code == 200, response.text
+    assert refresh(client, tokens).status_code == 401
+
+
+def test_access_token_is_not_a_refresh_token(client, make_user):
+    tokens = login(client, make_user()['username'])
+    response = client.post('/auth/refresh', json={'refresh_token': tokens['access_token']})
+    assert response.status_code == 401
+
+
+def test_epoch_bumped_by_other_worker_is_polled(client, make_user):
+    from sqlalchemy import update
+
+    from app.backend.db import async_session_marker
+    from app.backend.token_epochs import next_epoch
+    from app.models.user import User
+    from app.routers import auth
+
+    user = make_user()
+    tokens = login(client, user['username'])
+    assert client.get('/auth/read_current_user', headers=bearer(tokens)).status_code == 200
+
+    async def bump_epoch():
+        # Эпоху сдвигает другой процесс: словарь эпох этого воркера о ней не знает
+        async with async_session_marker() as session:
+            await session.execute(update(User).where(User.id == user['id']).values(**next_epoch()))
+            await session.commit()
+
+    client.portal.call(bump_epoch)
+    assert client.portal.call(auth.token_epoch_poller.poll)
+    assert client.get('/auth/read_current_user', headers=bearer(tokens)).status_code == 401
+    assert refresh(client, tokens).status_code == 200
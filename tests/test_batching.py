@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from app.backend.batching import BatchQueue, BatchQueueFull
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+class Recorder:
+    """ Функция сброса, которая запоминает пачки и падает заданное число раз """
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = 0
+        self.batches: list[list] = []
+
+    async def __call__(self, batch: list) -> None:
+        self.calls += 1
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('flush failed')
+        self.batches.append(list(batch))
+
+
+def test_close_drains_accepted_items():
+    flush = Recorder()
+
+    async def scenario():
+        queue = BatchQueue(flush, maxsize=100, batch_size=3, interval=10)
+        queue.start()
+        for item in range(7):
+            queue.put(item)
+        await queue.close()
+        return queue
+
+    queue = run(scenario)
+    assert [item for batch in flush.batches for item in batch] == list(range(7))
+    assert all(len(batch) <= 3 for batch in flush.batches)
+    assert not queue.running
+    assert queue.stats()['flushed'] == 7
+
+
+def test_put_after_close_is_rejected():
+    async def scenario():
+        queue = BatchQueue(Recorder(), maxsize=10, batch_size=10, interval=10)
+        queue.start()
+        await queue.close()
+        with pytest.raises(BatchQueueFull):
+            queue.put(1)
+
+    run(scenario)
+
+
+def test_full_queue_rejects():
+    async def scenario():
+        queue = BatchQueue(Recorder(), maxsize=1, batch_size=10, interval=10)
+        queue.start()
+        queue.put(1)
+        with pytest.raises(BatchQueueFull):
+            queue.put(2)
+        await queue.close()
+        return queue
+
+    assert run(scenario).rejected == 1
+
+
+def test_failed_flush_is_retried():
+    flush = Recorder(failures=2)
+
+    async def scenario():
+        queue = BatchQueue(flush, maxsize=10, batch_size=10, interval=0.01, retries=3, backoff=0.001)
+        queue.start()
+        queue.put('a')
+        queue.put('b')
+        await queue.close()
+        return queue
+
+    stats = run(scenario).stats()
+    assert flush.batches == [['a', 'b']]
+    assert flush.calls == 3
+    assert (stats['failed'], stats['dropped'], stats['flushed']) == (2, 0, 2)
+
+
+def test_batch_is_dropped_after_retries():
+    flush = Recorder(failures=3)
+
+    async def scenario():
+        queue = BatchQueue(flush, maxsize=10, batch_size=1, interval=0.01, retries=2, backoff=0.001)
+        queue.start()
+        queue.put('lost')
+        queue.put('kept')
+        await queue.close()
+        return queue
+
+    stats = run(scenario).stats()
+    assert flush.batches == [['kept']]
+    assert (stats['failed'], stats['dropped'], stats['flushed']) == (3, 1, 1)
@@ -0,0 +1,62 @@
+from conftest import PASSWORD, unique
+
+
+def new_user(username: str, email: str | None = None) -> dict:
+    return {'first_name': 'Bulk', 'last_name': 'User', 'username': username,
+            'email': email or f'{username}@example.com', 'password': PASSWORD}
+
+
+def test_bulk_reports_conflicts(client, admin, make_user):
+    existing = make_user()['username']
+    fresh = unique('bulk')
+    response = client.post('/auth/bulk', json={'users': [
+        new_user(fresh), new_user(existing, email=f'{unique("other")}@example.com'),
+        new_user(unique('bulk'), email=f'{existing}@example.com'), new_user(fresh),
+    ]}, headers=admin['headers'])
+    assert response.status_code == 201, response.text
+    body = response.json()
+    assert [user['username'] for user in body['created']] == [fresh]
+    assert [(conflict['index'], conflict['field']) for conflict in body['conflicts']] == [
+        (1, 'username'), (2, 'email'), (3, 'username')]
+
+
+def test_bulk_releases_connection_while_hashing(client, admin, monkeypatch):
+    from app.backend.db import engine
+    from app.routers import auth
+
+    hash_many = auth.password_hasher.hash_many
+    checked_out = []
+
+    async def hash_and_count(passwords):
+        checked_out.append(engine.pool.checkedout())
+        return await hash_many(passwords)
+
+    monkeypatch.setattr(auth.password_hasher, 'hash_many', hash_and_count)
+    response = client.post('/auth/bulk', json={'users': [new_user(unique('bulk'))]}, headers=admin['headers'])
+    assert response.status_code == 201, response.text
+    assert checked_out == [0]
+
+
+def test_bulk_names_field_of_concurrent_conflict(client, admin, monkeypatch):
+    from sqlalchemy import insert
+
+    from app.backend.db import async_session_marker
+    from app.models.user import User
+    from app.routers import auth
+
+    username = unique('bulk')
+    hash_many = auth.password_hasher.hash_many
+
+    async def hash_while_other_request_inserts(passwords):
+        # Пока идет bcrypt, другой запрос занимает email из пачки
+        async with async_session_marker() as session:
+            await session.execute(insert(User).values(username=unique('racer'), email=f'{username}@example.com'))
+            await session.commit()
+        return await hash_many(passwords)
+
+    monkeypatch.setattr(auth.password_hasher, 'hash_many', hash_while_other_request_inserts)
+    response = client.post('/auth/bulk', json={'users': [new_user(username)]}, headers=admin['headers'])
+    assert response.status_code == 201, response.text
+    assert response.json()['created'] == []
+    assert response.json()['conflicts'] == [
+        {'index': 0, 'username': username, 'field': 'email', 'detail': 'Already exists'}]
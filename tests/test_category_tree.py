@@ -0,0 +1,128 @@
+import pytest
+
+from app.backend.category_tree import CategoryTree
+
+#     1        5
+#    / \
+#   2   3
+#   |
+#   4
+ROWS = [(1, None), (2, 1), (3, 1), (4, 2), (5, None)]
+
+
+@pytest.fixture
+def tree() -> CategoryTree:
+    tree = CategoryTree(ttl=60)
+    tree.build(ROWS)
+    return tree
+
+
+def rebuilt(tree: CategoryTree) -> CategoryTree:
+    """ Эталон: дерево, построенное с нуля по текущей смежности """
+    fresh = CategoryTree(ttl=60)
+    fresh.build(tree._parents.items())
+    return fresh
+
+
+def assert_consistent(tree: CategoryTree) -> None:
+    fresh = rebuilt(tree)
+    for category_id in tree.ids():
+        assert tree.subtree(category_id) == fresh.subtree(category_id), category_id
+
+
+def test_build_collects_descendants(tree):
+    assert tree.subtree(1) == {1, 2, 3, 4}
+    assert tree.subtree(2) == {2, 4}
+    assert tree.subtree(4) == {4}
+    assert tree.subtree(5) == {5}
+    assert tree.subtree(99) is None
+
+
+def test_cold_tree_returns_none():
+    tree = CategoryTree(ttl=60)
+    assert tree.subtree(1) is None
+    tree.add(1, None)
+    assert tree.ids() == frozenset()
+
+
+def test_expired_tree_returns_none(tree):
+    tree.ttl = 0
+    assert tree.subtree(1) is None
+
+
+def test_add_updates_all_ancestors(tree):
+    tree.add(6, 4)
+    assert tree.subtree(6) == {6}
+    assert tree.subtree(4) == {4, 6}
+    assert tree.subtree(2) == {2, 4, 6}
+    assert tree.subtree(1) == {1, 2, 3, 4, 6}
+    assert tree.subtree(5) == {5}
+    assert_consistent(tree)
+
+
+def test_add_root(tree):
+    tree.add(6, None)
+    assert tree.subtree(6) == {6}
+    assert tree.subtree(1) == {1, 2, 3, 4}
+    assert_consistent(tree)
+
+
+def test_move_subtree_between_roots(tree):
+    tree.move(2, 5)
+    assert tree.subtree(1) == {1, 3}
+    assert tree.subtree(5) == {5, 2, 4}
+    assert tree.subtree(2) == {2, 4}
+    assert_consistent(tree)
+
+
+def test_move_to_root_and_back(tree):
+    tree.move(2, None)
+    assert tree.subtree(1) == {1, 3}
+    tree.move(2, 3)
+    assert tree.subtree(3) == {3, 2, 4}
+    assert tree.subtree(1) == {1, 2, 3, 4}
+    assert_consistent(tree)
+
+
+def test_move_to_same_parent_is_noop(tree):
+    tree.move(4, 2)
+    assert tree.subtree(2) == {2, 4}
+    assert_consistent(tree)
+
+
+def test_move_unknown_category_adds_it(tree):
+    tree.move(7, 3)
+    assert tree.subtree(3) == {3, 7}
+    assert tree.subtree(1) == {1, 2, 3, 4, 7}
+
+
+def test_would_cycle(tree):
+    assert tree.would_cycle(1, 4)
+    assert tree.would_cycle(2, 2)
+    assert not tree.would_cycle(2, 3)
+    assert not tree.would_cycle(2, None)
+
+
+def test_deep_tree_does_not_hit_recursion_limit():
+    depth = 5000
+    tree = CategoryTree(ttl=60)
+    tree.build([(1, None)] + [(number, number - 1) for number in range(2, depth + 1)])
+    assert len(tree.subtree(1)) == depth
+    tree.add(depth + 1, depth)
+    assert len(tree.subtree(1)) == depth + 1
+
+
+def test_random_operations_stay_consistent():
+    import random
+
+    generator = random.Random(7)
+    tree = CategoryTree(ttl=60)
+    tree.build([(1, None)])
+    for category_id in range(2, 200):
+        tree.add(category_id, generator.choice(sorted(tree.ids())))
+    for _ in range(300):
+        category_id = generator.choice(sorted(tree.ids()))
+        parent_id = generator.choice(sorted(tree.ids()) + [None])
+        if not tree.would_cycle(category_id, parent_id):
+            tree.move(category_id, parent_id)
+    assert_consistent(tree)
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+from app.cli import configure_environment, parse_args, pool_budget
+
+
+@pytest.mark.parametrize('total, workers, expected', [
+    (20, 1, (10, 10)),
+    (20, 4, (2, 3)),
+    (21, 4, (2, 3)),
+    (3, 2, (1, 0)),
+    (2, 2, (1, 0)),
+])
+def test_pool_budget(total, workers, expected):
+    assert pool_budget(total, workers) == expected
+
+
+@pytest.mark.parametrize('total, workers', [(100, 1), (100, 7), (64, 9), (5, 5)])
+def test_pool_budget_never_exceeds_total(total, workers):
+    pool_size, max_overflow = pool_budget(total, workers)
+    assert pool_size >= 1 and max_overflow >= 0
+    assert (pool_size + max_overflow) * workers <= total
+
+
+def test_pool_budget_rejects_too_few_connections():
+    with pytest.raises(ValueError):
+        pool_budget(3, 4)
+
+
+def test_configure_environment_splits_connections(monkeypatch):
+    # setenv запоминает исходное состояние переменной, и после теста оно восстанавливается
+    for name in ('DB_POOL_SIZE', 'DB_MAX_OVERFLOW', 'PASSWORD_HASH_WORKERS'):
+        monkeypatch.setenv(name, '')
+        monkeypatch.delenv(name)
+    configure_environment(parse_args(['--workers', '4', '--db-connections', '40']))
+    assert (os.environ['DB_POOL_SIZE'], os.environ['DB_MAX_OVERFLOW']) == ('5', '5')
+    assert int(os.environ['PASSWORD_HASH_WORKERS']) >= 1
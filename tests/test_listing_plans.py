@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from conftest import unique
+
+PARTIAL_INDEXES = {'ix_product_category_price', 'ix_product_category_rating',
+                   'ix_product_active_price', 'ix_product_active_rating'}
+
+
+@pytest.fixture
+def product_queries(client):
+    """ SQL по таблице product, которые приложение выполнило за время теста, с параметрами """
+    from sqlalchemy import event
+
+    from app.backend.db import read_engine
+
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if 'FROM product' in statement and not statement.startswith('EXPLAIN'):
+            captured.append((statement, parameters))
+
+    event.listen(read_engine.sync_engine, 'before_cursor_execute', capture)
+    yield captured
+    event.remove(read_engine.sync_engine, 'before_cursor_execute', capture)
+
+
+@pytest.fixture
+def listing_category(client, admin, category) -> dict:
+    """ Категория с товарами, часть которых без остатка; создание товаров сбрасывает кэш ответов """
+    for number in range(6):
+        response = client.post('/products/', json={
+            'name': unique('listed'), 'description': 'Listed product', 'price': 10.0 * (number + 1),
+            'stock': number % 3, 'category_id': category['id'],
+        }, headers=admin['headers'])
+        assert response.status_code == 201, response.text
+    return category
+
+
+def explain(client, statement: str, parameters) -> dict:
+    """ План запроса; последовательное чтение запрещено, чтобы на маленькой таблице было видно, подходит ли индекс """
+    from app.backend.db import read_engine
+
+    async def run():
+        async with read_engine.connect() as conn:
+            await conn.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            plan = (await conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters)).scalar()
+            await conn.rollback()
+        return json.loads(plan) if isinstance(plan, str) else plan
+
+    return client.portal.call(run)[0]['Plan']
+
+
+def index_names(plan: dict) -> set[str]:
+    names = {plan['Index Name']} if 'Index Name' in plan else set()
+    for child in plan.get('Plans', ()):
+        names |= index_names(child)
+    return names
+
+
+def index_conds(plan: dict) -> list[str]:
+    conds = [plan['Index Cond']] if 'Index Cond' in plan else []
+    for child in plan.get('Plans', ()):
+        conds += index_conds(child)
+    return conds
+
+
+def plans(client, product_queries) -> list[dict]:
+    assert product_queries, 'no product query was executed'
+    return [explain(client, statement, parameters) for statement, parameters in product_queries]
+
+
+def plan_indexes(client, product_queries) -> set[str]:
+    names = set()
+    for plan in plans(client, product_queries):
+        names |= index_names(plan)
+    return names
+
+
+def price_bounded_by_index(client, product_queries, operator: str) -> bool:
+    """ Граница цены попала в условие индекса, а не в фильтр поверх просмотренных строк """
+    return any(f'price {operator}' in cond and 'double precision' not in cond
+               for plan in plans(client, product_queries) for cond in index_conds(plan))
+
+
+@pytest.mark.parametrize('sort, index', [
+    ('price', 'ix_product_active_price'),
+    ('-rating', 'ix_product_active_rating'),
+])
+def test_listing_uses_partial_index(client, admin, listing_category, product_queries, sort, index):
+    response = client.get('/products/', params={'sort': sort, 'min_price': 15},
+                          headers=admin['headers'])
+    assert response.status_code == 200, response.text
+    assert index in plan_indexes(client, product_queries)
+
+
+@pytest.mark.parametrize('sort, index', [
+    ('price', 'ix_product_category_price'),
+    ('rating', 'ix_product_category_rating'),
+])
+def test_category_listing_uses_partial_index(client, admin, listing_category, product_queries, sort, index):
+    response = client.get(f"/products/{listing_category['slug']}", params={'sort': sort, 'max_price': 1000},
+                          headers=admin['headers'])
+    assert response.status_code == 200, response.text
+    assert index in plan_indexes(client, product_queries)
+
+
+def test_facets_use_partial_index(client, admin, listing_category, product_queries):
+    response = client.get('/products/facets', params={'category_slug': listing_category['slug']},
+                          headers=admin['headers'])
+    assert response.status_code == 200, response.text
+    assert response.json()['total'] > 0
+    assert plan_indexes(client, product_queries) & PARTIAL_INDEXES
+
+
+def test_listing_price_range_is_index_bound(client, admin, listing_category, product_queries):
+    response = client.get('/products/', params={'sort': 'price', 'min_price': 15},
+                          headers=admin['headers'])
+    assert response.status_code == 200, response.text
+    assert price_bounded_by_index(client, product_queries, '>=')
+
+
+def test_category_listing_price_range_is_index_bound(client, admin, listing_category, product_queries):
+    response = client.get(f"/products/{listing_category['slug']}", params={'sort': 'price', 'max_price': 1000},
+                          headers=admin['headers'])
+    assert response.status_code == 200, response.text
+    assert price_bounded_by_index(client, product_queries, '<=')
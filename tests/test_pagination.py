@@ -0,0 +1,43 @@
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import Column, Integer, Numeric, String
+
+from app.routers.pagination import decode_cursor, encode_cursor
+
+PRICE = Column('price', Numeric(10, 2))
+RATING = Column('rating', Integer)
+NAME = Column('name', String)
+
+
+@pytest.mark.parametrize('sort, column, value', [
+    ('price', PRICE, Decimal('19.90')),
+    ('-rating', RATING, 4),
+    ('name', NAME, 'Кружка "Утро"'),
+    ('price', PRICE, None),
+])
+def test_cursor_round_trip(sort, column, value):
+    cursor = encode_cursor(sort, value, 42)
+    assert '=' not in cursor
+    assert decode_cursor(cursor, sort, column) == (value, 42)
+
+
+def test_decimal_keeps_precision():
+    value, _ = decode_cursor(encode_cursor('price', Decimal('0.10'), 1), 'price', PRICE)
+    assert isinstance(value, Decimal)
+    assert value == Decimal('0.10')
+
+
+def test_cursor_for_other_sort_is_rejected():
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(encode_cursor('price', Decimal('1'), 1), '-price', PRICE)
+    assert error.value.status_code == 400
+
+
+@pytest.mark.parametrize('cursor', ['not-a-cursor', '', encode_cursor('price', 'abc', 1),
+                                    encode_cursor('price', Decimal('1'), 'x')])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, 'price', PRICE)
+    assert error.value.status_code == 400
@@ -0,0 +1,139 @@
+import json
+import re
+
+import pytest
+
+from conftest import unique
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def statements(response) -> int:
+    """ Число SQL-запросов за HTTP-запрос из заголовка Server-Timing """
+    return int(SERVER_TIMING_QUERIES.search(response.headers['Server-Timing']).group(1))
+
+
+def product_json(category: dict, name: str, **fields) -> dict:
+    return {'name': name, 'description': 'Test product', 'price': 100.0, 'stock': 10,
+            'category_id': category['id'], **fields}
+
+
+@pytest.fixture
+def supplier(make_user):
+    return make_user(is_supplier=True, is_customer=False)
+
+
+@pytest.fixture
+def product(client, supplier, category) -> dict:
+    name = unique('product')
+    response = client.post('/products/', json=product_json(category, name), headers=supplier['headers'])
+    assert response.status_code == 201, response.text
+    return {'name': name, 'slug': name}
+
+
+def test_create_product_is_one_statement(client, supplier, category):
+    response = client.post('/products/', json=product_json(category, unique('product')), headers=supplier['headers'])
+    assert response.status_code == 201, response.text
+    assert statements(response) == 1
+
+
+def test_create_product_unknown_category(client, supplier, category):
+    response = client.post('/products/', json=product_json({'id': 2_000_000_000}, unique('product')),
+                           headers=supplier['headers'])
+    assert response.status_code == 404
+
+
+def test_owner_updates_product_in_one_statement(client, supplier, category, product):
+    name = unique('renamed')
+    response = client.put(f"/products/{product['slug']}", json=product_json(category, name, price=55.0),
+                          headers=supplier['headers'])
+    assert response.status_code == 200, response.text
+    assert statements(response) == 1
+
+    details = client.get(f'/products/details/{name}', headers=supplier['headers'])
+    assert details.status_code == 200
+    assert details.json()['price'] == 55.0
+
+
+def test_other_supplier_cannot_update(client, make_user, category, product):
+    other = make_user(is_supplier=True, is_customer=False)
+    response = client.put(f"/products/{product['slug']}", json=product_json(category, unique('stolen')),
+                          headers=other['headers'])
+    assert response.status_code == 403
+    # UPDATE не затронул строк, затем SELECT выясняет причину
+    assert statements(response) == 2
+
+    details = client.get(f"/products/details/{product['slug']}", headers=other['headers'])
+    assert details.status_code == 200
+
+
+def test_admin_updates_any_product(client, admin, category, product):
+    response = client.put(f"/products/{product['slug']}", json=product_json(category, unique('admin')),
+                          headers=admin['headers'])
+    assert response.status_code == 200, response.text
+    assert statements(response) == 1
+
+
+def test_update_missing_product(client, supplier, category):
+    response = client.put(f"/products/{unique('missing')}", json=product_json(category, unique('product')),
+                          headers=supplier['headers'])
+    assert response.status_code == 404
+
+
+def test_owner_deletes_product_in_one_statement(client, supplier, product):
+    response = client.delete(f"/products/{product['slug']}", headers=supplier['headers'])
+    assert response.status_code == 200, response.text
+    assert statements(response) == 1
+
+
+def test_other_supplier_cannot_delete(client, make_user, product):
+    other = make_user(is_supplier=True, is_customer=False)
+    response = client.delete(f"/products/{product['slug']}", headers=other['headers'])
+    assert response.status_code == 403
+
+
+def test_delete_missing_product(client, supplier):
+    response = client.delete(f"/products/{unique('missing')}", headers=supplier['headers'])
+    assert response.status_code == 404
+
+
+def test_reviews_by_product_is_one_statement(client, supplier, product):
+    product_id = client.get(f"/products/details/{product['slug']}", headers=supplier['headers']).json()['id']
+    for grade in (4, 5):
+        response = client.post('/reviews/', json={'product_id': product_id, 'comment': 'ok', 'grade': grade},
+                               headers=supplier['headers'])
+        assert response.status_code == 201, response.text
+
+    response = client.get(f"/reviews/{product['slug']}", headers=supplier['headers'])
+    assert response.status_code == 200
+    assert len(response.json()['items']) == 2
+    assert statements(response) == 1
+
+
+def test_bulk_accepts_category_missing_from_tree_snapshot(client, supplier, category):
+    from app.backend.db import async_session_marker
+    from app.models.category import Category
+
+    def bulk(*rows: dict):
+        body = '\n'.join(json.dumps(row) for row in rows)
+        return client.post('/products/bulk', content=body, headers={
+            **supplier['headers'], 'Content-Type': 'application/x-ndjson'})
+
+    # Первый импорт прогревает дерево категорий воркера
+    assert bulk(product_json(category, unique('bulk'))).json()['created'] == 1
+
+    async def create_category():
+        # Категория создается в обход API, как если бы ее добавил другой воркер
+        async with async_session_marker() as session:
+            row = Category(name=unique('foreign'), slug=unique('foreign'))
+            session.add(row)
+            await session.commit()
+            return row.id
+
+    foreign_id = client.portal.call(create_category)
+    response = bulk(product_json({'id': foreign_id}, unique('bulk')),
+                    product_json({'id': 2_000_000_000}, unique('bulk')))
+    assert response.status_code == 200, response.text
+    result = response.json()
+    assert result['created'] == 1
+    assert result['errors'] == [{'row': 2, 'detail': 'There is no category found'}]
@@ -0,0 +1,57 @@
+import asyncio
+
+from conftest import PASSWORD
+from app.backend.rate_limit import MemoryRateLimitStore, TokenBucketLimiter
+
+
+def test_check_does_not_consume():
+    limiter = TokenBucketLimiter(MemoryRateLimitStore(), per_minute=1, burst=2)
+
+    async def run():
+        assert [await limiter.check('key') for _ in range(5)] == [0.0] * 5
+        assert await limiter.hit('key') == 0.0
+        assert await limiter.hit('key') == 0.0
+        assert await limiter.check('key') > 0
+        assert await limiter.hit('key') > 0
+
+    asyncio.run(run())
+
+
+def test_buckets_are_independent():
+    store = MemoryRateLimitStore()
+    limiter = TokenBucketLimiter(store, per_minute=1, burst=1)
+
+    async def run():
+        assert await limiter.hit('user:a') == 0.0
+        assert await limiter.check('user:a') > 0
+        assert await limiter.check('user:b') == 0.0
+
+    asyncio.run(run())
+
+
+def test_disabled_limiter_allows_everything():
+    limiter = TokenBucketLimiter(MemoryRateLimitStore(), per_minute=0, burst=10)
+
+    async def run():
+        assert all([await limiter.hit('key') == 0.0 for _ in range(100)])
+        assert await limiter.check('key') == 0.0
+
+    asyncio.run(run())
+
+
+def test_login_charges_username_only_on_failure(client, make_user, monkeypatch):
+    from app.routers import auth
+
+    username = make_user()['username']
+    monkeypatch.setattr(auth, 'login_ip_limiter', TokenBucketLimiter(MemoryRateLimitStore(), per_minute=1, burst=100))
+    monkeypatch.setattr(auth, 'login_username_limiter',
+                        TokenBucketLimiter(MemoryRateLimitStore(), per_minute=1, burst=2))
+
+    def login(password: str) -> int:
+        return client.post('/auth/token', data={'username': username, 'password': password}).status_code
+
+    assert [login(PASSWORD) for _ in range(3)] == [200] * 3
+    assert [login('wrong') for _ in range(2)] == [401] * 2
+    assert login(PASSWORD) == 429
+    # Отказ по логину не тратит попытки IP
+    assert auth.login_ip_limiter.allowed == 5
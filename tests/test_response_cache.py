@@ -0,0 +1,36 @@
+import pytest
+
+from conftest import unique
+from app.backend.response_cache import CacheBackend
+
+
+def test_incomplete_backend_fails_on_creation():
+    class GetOnly(CacheBackend):
+        async def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        GetOnly()
+
+
+def test_writer_bypasses_shared_cache(client, make_user, category):
+    from app.backend.response_cache import response_cache
+
+    writer = make_user(is_supplier=True)
+    reader = make_user()
+    name = unique('cached')
+    response = client.post('/products/', json={'name': name, 'description': 'd', 'price': 1.0,
+                                               'stock': 1, 'category_id': category['id']},
+                           headers=writer['headers'])
+    assert response.status_code == 201, response.text
+
+    # Другой пользователь кладет ответ в общий кэш; подменяем его, как если бы он был прочитан с отстающей реплики
+    assert client.get(f'/products/details/{name}', headers=reader['headers']).status_code == 200
+    stale = b'"stale"\n{"slug":"stale"}'
+    for key in list(response_cache.backend.entries._data):
+        response_cache.backend.entries.set(key, stale, ttl=60)
+    assert client.get(f'/products/details/{name}', headers=reader['headers']).json()['slug'] == 'stale'
+
+    bypassed = response_cache.bypassed
+    assert client.get(f'/products/details/{name}', headers=writer['headers']).json()['slug'] == name
+    assert response_cache.bypassed == bypassed + 1
@@ -0,0 +1,108 @@
+import asyncio
+
+from app.backend.singleflight import SingleFlight
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+class Loader:
+    """ Загрузка, которая ждет разрешения завершиться и возвращает номер своего запуска """
+    def __init__(self):
+        self.started = 0
+        self.release = asyncio.Event()
+
+    async def __call__(self) -> int:
+        self.started += 1
+        number = self.started
+        await self.release.wait()
+        return number
+
+
+def test_concurrent_calls_share_one_load():
+    async def scenario():
+        flight, load = SingleFlight(ttl=0), Loader()
+        calls = [asyncio.ensure_future(flight.do('key', load)) for _ in range(5)]
+        await asyncio.sleep(0)
+        load.release.set()
+        return flight, load, await asyncio.gather(*calls)
+
+    flight, load, results = run(scenario)
+    assert results == [1] * 5
+    assert load.started == 1
+    stats = flight.stats()
+    assert (stats['executions'], stats['collapsed'], stats['in_flight']) == (1, 4, 0)
+
+
+def test_without_ttl_result_is_not_kept():
+    async def scenario():
+        flight, load = SingleFlight(ttl=0), Loader()
+        load.release.set()
+        return [await flight.do('key', load), await flight.do('key', load)]
+
+    assert run(scenario) == [1, 2]
+
+
+def test_ttl_keeps_result_until_clear():
+    async def scenario():
+        flight, load = SingleFlight(ttl=60), Loader()
+        load.release.set()
+        results = [await flight.do('key', load), await flight.do('key', load)]
+        flight.clear()
+        results.append(await flight.do('key', load))
+        return flight, results
+
+    flight, results = run(scenario)
+    assert results == [1, 1, 2]
+    assert flight.cached == 1
+
+
+def test_clear_detaches_new_calls_from_running_load():
+    async def scenario():
+        flight = SingleFlight(ttl=60)
+        stale, fresh = Loader(), Loader()
+        first = asyncio.ensure_future(flight.do('key', stale))
+        await asyncio.sleep(0)
+        flight.clear()
+        second = asyncio.ensure_future(flight.do('key', fresh))
+        await asyncio.sleep(0)
+        # Старая загрузка завершается первой и не должна снять с учета новую
+        stale.release.set()
+        assert await first == 1
+        assert flight.stats()['in_flight'] == 1
+        third = asyncio.ensure_future(flight.do('key', fresh))
+        await asyncio.sleep(0)
+        fresh.release.set()
+        results = await asyncio.gather(second, third)
+        return flight, stale, fresh, results, await flight.do('key', fresh)
+
+    flight, stale, fresh, results, cached = run(scenario)
+    assert (stale.started, fresh.started) == (1, 1)
+    assert results == [1, 1]
+    # Результат загрузки, начатой до clear(), не сохраняется, а новой - сохраняется
+    assert cached == 1
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_failed_load_is_not_kept():
+    async def scenario():
+        flight = SingleFlight(ttl=60)
+        attempts = 0
+
+        async def load():
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1:
+                raise RuntimeError('load failed')
+            return attempts
+
+        try:
+            await flight.do('key', load)
+        except RuntimeError:
+            pass
+        return flight, await flight.do('key', load)
+
+    flight, result = run(scenario)
+    assert result == 2
+    assert flight.stats()['in_flight'] == 0